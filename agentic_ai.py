@@ -5,6 +5,7 @@ from typing import Dict, List, Any, Optional
 import uuid
 import json
 import logging
+import orjson
 import asyncio
 import requests # Necessary for external API calls (Gemini)
 
@@ -86,7 +87,7 @@ async def call_gemini_api_structured(payload: Dict[str, Any], schema: Dict[str,
             json_text = result.get('candidates', [{}])[0].get('content', {}).get('parts', [{}])[0].get('text')
             
             if json_text:
-                return json.loads(json_text)
+                return orjson.loads(json_text)
             return None
             
         except requests.exceptions.RequestException as e:
@@ -11,7 +11,7 @@ from datetime import datetime, timedelta
 import os
 import json
 from pydantic import Field
-from groq import Groq
+from groq import Groq, AsyncGroq
 
 # Import the API client
 from api_client import SpringBootAPIClient, APIClientManager
@@ -21,6 +21,7 @@ class GroqLLM(LLM):
     """Custom LangChain wrapper for Groq API"""
     
     client: Any = Field(default=None, exclude=True)
+    async_client: Any = Field(default=None, exclude=True)
     model: str = "llama-3.3-70b-versatile"
     temperature: float = 0.7
     max_tokens: int = 4096
@@ -28,6 +29,7 @@ class GroqLLM(LLM):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+        self.async_client = AsyncGroq(api_key=os.getenv("GROQ_API_KEY"))
     
     @property
     def _llm_type(self) -> str:
@@ -46,12 +48,18 @@ class GroqLLM(LLM):
         except Exception as e:
             return f"Error calling Groq: {str(e)}"
     
-    async def _acall(self, prompt: str, stop: Optional[List[str]] = None) -> str:
-        import concurrent.futures
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            return await asyncio.get_event_loop().run_in_executor(
-                executor, self._call, prompt, stop
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None, **kwargs) -> str:
+        try:
+            response = await self.async_client.chat.completions.create(
+                model=self.model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=self.temperature,
+                max_tokens=self.max_tokens,
+                stop=stop
             )
+            return response.choices[0].message.content
+        except Exception as e:
+            return f"Error calling Groq: {str(e)}"
 
 
 class PersonalAssistant:
@@ -1,18 +1,75 @@
 import os
 import re
-import json
+import asyncio
+import io
+import hashlib
+import itertools
+import multiprocessing
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from io import BytesIO
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Union, BinaryIO
 from fastapi import FastAPI, UploadFile, File, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import PlainTextResponse
-from pydantic import BaseModel
-import PyPDF2
-from groq import Groq
-
-app = FastAPI(title="Script Analyzer AI with Screenplay Generator", version="2.0.0")
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+import httpx
+import orjson
+import pypdf
+import redis.asyncio as redis
+from groq import AsyncGroq
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:  # fall back to the pure-Python pypdf extractor
+    pdfium = None
+
+app = FastAPI(
+    title="Script Analyzer AI with Screenplay Generator",
+    version="2.0.0",
+    default_response_class=ORJSONResponse
+)
 
-client = Groq(api_key="")
+# Created on startup inside the serving event loop and shared by every request
+http_client: Optional[httpx.AsyncClient] = None
+client: Optional[AsyncGroq] = None
+
+GROQ_MODEL = "llama-3.3-70b-versatile"
+GROQ_EXTRACTION_MODEL = "llama-3.1-8b-instant"
+GROQ_CACHE_SIZE = 256
+CHUNK_CONCURRENCY = 5
+# Output budget for a chunk extraction grows with the pages it covers (3000 for a full 5-page chunk)
+CHUNK_OUTPUT_TOKENS_BASE = 500
+CHUNK_OUTPUT_TOKENS_PER_PAGE = 500
+SCENE_CONCURRENCY = 16
+_groq_cache: "OrderedDict[str, str]" = OrderedDict()
+
+# Redis cache of finished analyses (optional; disabled when REDIS_URL is unset).
+# Bump ANALYSIS_PROMPT_VERSION whenever the analysis prompts change.
+REDIS_URL = os.getenv("REDIS_URL")
+ANALYSIS_PROMPT_VERSION = "2"
+ANALYSIS_CACHE_TTL_SECONDS = 24 * 3600
+PDF_CACHE_TTL_SECONDS = 24 * 3600
+redis_client = redis.from_url(REDIS_URL) if REDIS_URL else None
+
+WORD_RE = re.compile(r"\S+")
+# Scene headings (optionally numbered): "INT. HOUSE - NIGHT", "12 EXT. ROAD - DAY", "INT/EXT. CAR"
+SCENE_HEADING_RE = re.compile(r"^[ \t]*(?:\d+[A-Z]?[ \t]+)?(?:INT\.?/EXT|EXT\.?/INT|I/E|INT|EXT)\b", re.M)
+
+MAX_PDF_BYTES = 50 << 20
+# PDFs with at least this many pages are split across worker processes for extraction
+PARALLEL_PDF_MIN_PAGES = 40
+# Uvicorn worker processes. One by default, so the in-process Groq cache and in-flight analysis
+# dedup see every request; each extra worker gets an equal share of the cores for PDF extraction
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+PDF_WORKERS = max(1, (os.cpu_count() or 1) // WEB_CONCURRENCY)
+# Spawned, not forked: a fork taken while a request thread holds PDFIUM_LOCK would hand every
+# worker a lock that is held forever
+pdf_process_pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+# PDFium is not thread-safe; calls into it are serialized within a process
+PDFIUM_LOCK = threading.Lock()
 
 app.add_middleware(
     CORSMiddleware,
@@ -21,6 +78,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Analyses and screenplays are tens of KB of JSON/text; compress anything over 1 KB
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
 
 class Character(BaseModel):
     name: str
@@ -100,63 +159,157 @@ class ScreenplayRequest(BaseModel):
     scene_numbers: Optional[List[int]] = None
     style: str = "standard"
 
+class AnalyzeTextRequest(BaseModel):
+    script_text: str = Field(..., min_length=100)
+
 # ============= ORIGINAL SCRIPT ANALYZER FUNCTIONS =============
 
-def extract_text_from_pdf(pdf_file: BytesIO) -> (List[str], int):
-    """Extract text from PDF and return list of page texts"""
-    pdf_reader = PyPDF2.PdfReader(pdf_file)
+def read_pdf_pages(pdf_source: Union[bytes, BinaryIO], start: int = 0, end: Optional[int] = None) -> List[str]:
+    """Extract the text of pages [start, end) with PDFium when installed, otherwise pypdf"""
+    if not isinstance(pdf_source, bytes):
+        pdf_source.seek(0)
+    if pdfium is not None:
+        with PDFIUM_LOCK:
+            pdf = pdfium.PdfDocument(pdf_source)
+            try:
+                texts = []
+                for i in range(start, len(pdf) if end is None else end):
+                    page = pdf[i]
+                    textpage = page.get_textpage()
+                    texts.append(textpage.get_text_range())
+                    textpage.close()
+                    page.close()
+                return texts
+            finally:
+                pdf.close()
+    
+    pdf_reader = pypdf.PdfReader(BytesIO(pdf_source) if isinstance(pdf_source, bytes) else pdf_source)
+    end = len(pdf_reader.pages) if end is None else end
+    return [pdf_reader.pages[i].extract_text() for i in range(start, end)]
+
+def extract_text_from_pdf(pdf_file: BinaryIO) -> (List[str], int):
+    """Extract text from PDF and return the non-empty page texts and the PDF's page count"""
+    texts = read_pdf_pages(pdf_file)
+    return [text for text in texts if text], len(texts)
+
+def extract_page_range(pdf_bytes: bytes, start: int, end: int) -> List[str]:
+    """Extract the text of pages [start, end); runs inside a worker process"""
+    return read_pdf_pages(pdf_bytes, start, end)
+
+def count_pdf_pages(pdf_file: BinaryIO) -> int:
+    pdf_file.seek(0)
+    if pdfium is not None:
+        with PDFIUM_LOCK:
+            pdf = pdfium.PdfDocument(pdf_file)
+            try:
+                return len(pdf)
+            finally:
+                pdf.close()
+    return len(pypdf.PdfReader(pdf_file).pages)
+
+async def extract_pdf_pages(pdf_file: BinaryIO) -> (List[str], int):
+    """Extract page texts off the event loop, fanning large PDFs out over the process pool"""
+    # PDFium allows only one call at a time per process (even across documents),
+    # so worker processes rather than threads are what parallelize it
+    total_pages = await asyncio.to_thread(count_pdf_pages, pdf_file)
+    if total_pages < PARALLEL_PDF_MIN_PAGES or PDF_WORKERS == 1:
+        return await asyncio.to_thread(extract_text_from_pdf, pdf_file)
+    
+    # Worker processes need picklable arguments, so hand them the raw bytes
+    pdf_file.seek(0)
+    pdf_bytes = await asyncio.to_thread(pdf_file.read)
+    loop = asyncio.get_running_loop()
+    step = -(-total_pages // PDF_WORKERS)
+    parts = await asyncio.gather(*(
+        loop.run_in_executor(pdf_process_pool, extract_page_range, pdf_bytes, start, min(start + step, total_pages))
+        for start in range(0, total_pages, step)
+    ))
+    pages = [text for part in parts for text in part if text]
+    return pages, total_pages
+
+def split_text_into_pages(script_text: str, words_per_page: int = 250) -> List[str]:
+    """Split raw script text into pages of words_per_page words by slicing at word offsets"""
     pages = []
-    for page in pdf_reader.pages:
-        text = page.extract_text()
-        if text:
-            pages.append(text)
-    return pages, len(pages)
+    start = None
+    for i, match in enumerate(WORD_RE.finditer(script_text)):
+        if i % words_per_page == 0:
+            if start is not None:
+                pages.append(script_text[start:match.start()].rstrip())
+            start = match.start()
+    if start is not None:
+        pages.append(script_text[start:].rstrip())
+    return pages
 
 def chunk_pages(pages: List[str], pages_per_chunk: int = 5) -> List[Dict[str, Any]]:
-    """Split pages into chunks of specified size"""
+    """Split pages into chunks of specified size, ending each chunk at a scene heading so no scene is cut in two"""
     chunks = []
+    carry = ""
     for i in range(0, len(pages), pages_per_chunk):
         chunk_pages = pages[i:i + pages_per_chunk]
-        chunk_text = "\n\n".join(chunk_pages)
+        if carry:
+            chunk_pages = [carry] + chunk_pages
+            carry = ""
+        if i + pages_per_chunk < len(pages):
+            # Hand the trailing partial scene over to the next chunk
+            last_page = chunk_pages[-1]
+            heading = None
+            for heading in SCENE_HEADING_RE.finditer(last_page):
+                pass
+            if heading is not None and heading.start() > 0:
+                chunk_pages[-1] = last_page[:heading.start()]
+                carry = last_page[heading.start():]
         chunks.append({
-            "text": chunk_text,
+            "pages": chunk_pages,
             "start_page": i + 1,
             "end_page": min(i + pages_per_chunk, len(pages)),
-            "page_count": len(chunk_pages)
+            "page_count": min(i + pages_per_chunk, len(pages)) - i
         })
     return chunks
 
-def call_groq(prompt: str, max_tokens: int = 4000, temperature: float = 0.3) -> str:
-    response = client.chat.completions.create(
-        model="llama-3.3-70b-versatile",
-        messages=[{"role": "user", "content": prompt}],
+async def call_groq(
+    prompt: str,
+    max_tokens: int = 4000,
+    temperature: float = 0.3,
+    json_mode: bool = False,
+    model: str = GROQ_MODEL,
+    system: Optional[str] = None
+) -> str:
+    """Call Groq, reusing the response of an identical earlier request"""
+    digest = hashlib.sha256(prompt.encode())
+    if system:
+        digest.update(system.encode())
+    cache_key = f"{model}:{max_tokens}:{temperature}:{json_mode}:{digest.hexdigest()}"
+    cached = _groq_cache.get(cache_key)
+    if cached is not None:
+        _groq_cache.move_to_end(cache_key)
+        return cached
+
+    # Static instructions go first so the provider can reuse its cached prefix
+    messages = [{"role": "system", "content": system}] if system else []
+    messages.append({"role": "user", "content": prompt})
+    extra = {"response_format": {"type": "json_object"}} if json_mode else {}
+    response = await client.chat.completions.create(
+        model=model,
+        messages=messages,
         temperature=temperature,
-        max_tokens=max_tokens
+        max_tokens=max_tokens,
+        **extra
     )
-    return response.choices[0].message.content
+    content = response.choices[0].message.content
 
-def extract_json_from_response(response_text: str) -> str:
-    """Extract JSON from response that might be wrapped in markdown code blocks"""
-    json_match = re.search(r'```(?:json)?\s*(\{.*\})\s*```', response_text, re.DOTALL)
-    if json_match:
-        return json_match.group(1)
-    
-    json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-    if json_match:
-        return json_match.group(0)
-    
-    return response_text
+    _groq_cache[cache_key] = content
+    if len(_groq_cache) > GROQ_CACHE_SIZE:
+        _groq_cache.popitem(last=False)
+    return content
 
-def analyze_chunk(chunk: Dict[str, Any], chunk_index: int, total_chunks: int) -> dict:
-    """Analyze a single chunk of the script"""
-    prompt = f"""
-You are analyzing chunk {chunk_index + 1} of {total_chunks} (pages {chunk['start_page']}-{chunk['end_page']}) of a film script.
+# Static system prompts: identical on every call, so nothing request-specific may appear in them
+CHUNK_SYSTEM_PROMPT = """You analyze one chunk of a film script at a time.
 
 Return ONLY valid JSON with this structure:
 
-{{
+{
   "scenes": [
-    {{
+    {
       "scene_number": 0,
       "scene_heading": "string",
       "int_ext": "INT/EXT",
@@ -170,106 +323,63 @@ Return ONLY valid JSON with this structure:
       "estimated_setup_time_minutes": 0,
       "estimated_shoot_time_minutes": 0,
       "complexity_score": 0
-    }}
+    }
   ],
   "characters_found": ["character_name"],
   "locations_found": ["location_name"],
   "props_found": ["prop_name"],
   "special_requirements_found": ["requirement_description"]
-}}
-
-Extract all scenes, characters, locations, props, and special requirements from this chunk.
-
-Script chunk:
-{chunk['text']}
-"""
-    
-    response_text = call_groq(prompt, max_tokens=3000)
-    json_text = extract_json_from_response(response_text)
-    
-    try:
-        return json.loads(json_text)
-    except json.JSONDecodeError:
-        return {
-            "scenes": [],
-            "characters_found": [],
-            "locations_found": [],
-            "props_found": [],
-            "special_requirements_found": []
-        }
-
-def synthesize_analysis(chunk_analyses: List[dict], total_pages: int, script_preview: str) -> dict:
-    """Combine chunk analyses into final comprehensive analysis"""
-    
-    all_characters = set()
-    all_locations = set()
-    all_props = set()
-    all_requirements = set()
-    all_scenes = []
-    
-    for chunk_analysis in chunk_analyses:
-        all_characters.update(chunk_analysis.get("characters_found", []))
-        all_locations.update(chunk_analysis.get("locations_found", []))
-        all_props.update(chunk_analysis.get("props_found", []))
-        all_requirements.update(chunk_analysis.get("special_requirements_found", []))
-        all_scenes.extend(chunk_analysis.get("scenes", []))
-    
-    prompt = f"""
-Based on the analyzed script data, create a comprehensive production analysis.
+}
 
-Total Pages: {total_pages}
-Total Scenes: {len(all_scenes)}
-Characters Found: {', '.join(list(all_characters)[:20])}
-Locations Found: {', '.join(list(all_locations)[:20])}
+Extract all scenes, characters, locations, props, and special requirements from the chunk."""
 
-Script Preview (first 1000 chars):
-{script_preview[:1000]}
+SYNTHESIS_SYSTEM_PROMPT = """Based on analyzed script data, you create a comprehensive production analysis.
 
 Return ONLY valid JSON matching this exact schema:
 
-{{
+{
   "script_title": "string",
-  "total_pages": {total_pages},
-  "total_scenes": {len(all_scenes)},
+  "total_pages": 0,
+  "total_scenes": 0,
   "estimated_shoot_days": 0,
   "estimated_budget_range": "string",
   "characters": [
-    {{
+    {
       "name": "string",
       "role": "string",
       "description": "string",
       "first_appearance_scene": 1,
       "total_scenes": 0,
       "suggested_casting_notes": "string"
-    }}
+    }
   ],
   "locations": [
-    {{
+    {
       "name": "string",
       "type": "INT/EXT",
       "scenes": [1],
       "total_scenes": 0,
       "logistical_notes": "string",
       "estimated_setup_complexity": "Low"
-    }}
+    }
   ],
   "props": [
-    {{
+    {
       "name": "string",
       "category": "string",
       "scenes": [1],
       "importance": "Medium",
       "description": "string"
-    }}
+    }
   ],
   "special_requirements": [
-    {{
+    {
       "type": "string",
       "description": "string",
       "scenes": [1],
       "complexity": "Medium",
       "estimated_cost_impact": "Medium"
-    }}
+    }
   ],
   "genre": "string",
   "tone": "string",
@@ -277,97 +387,179 @@ Return ONLY valid JSON matching this exact schema:
   "key_challenges": ["string"],
   "budget_considerations": ["string"],
   "scheduling_recommendations": ["string"]
-}}
+}
+
+Use the given Total Pages and Total Scenes for total_pages and total_scenes.
 
 For casting notes: Suggest only Malayalam and Indian actors. For characters under 18, suggest only age-appropriate actors. Include recent work (2015-2024), IMDb ratings, and why they fit. Format as bullet points.
 
-Generate comprehensive metadata but keep scenes list from chunk analysis.
+Generate comprehensive metadata but keep scenes list from chunk analysis."""
+
+async def analyze_chunk(chunk: Dict[str, Any], chunk_index: int, total_chunks: int) -> dict:
+    """Analyze a single chunk of the script"""
+    chunk_text = "\n\n".join(chunk["pages"])
+    prompt = f"""Chunk {chunk_index + 1} of {total_chunks} (pages {chunk['start_page']}-{chunk['end_page']}).
+
+Script chunk:
+{chunk_text}
 """
     
-    response_text = call_groq(prompt, max_tokens=4000)
-    json_text = extract_json_from_response(response_text)
+    response_text = await call_groq(
+        prompt,
+        max_tokens=CHUNK_OUTPUT_TOKENS_BASE + CHUNK_OUTPUT_TOKENS_PER_PAGE * chunk["page_count"],
+        json_mode=True,
+        model=GROQ_EXTRACTION_MODEL,
+        system=CHUNK_SYSTEM_PROMPT
+    )
     
     try:
-        synthesis = json.loads(json_text)
+        return orjson.loads(response_text)
+    except orjson.JSONDecodeError as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to analyze chunk {chunk_index + 1}: {str(e)}"
+        )
+
+async def synthesize_analysis(chunk_analyses: List[dict], total_pages: int, script_preview: str) -> dict:
+    """Combine chunk analyses into final comprehensive analysis"""
+    
+    all_characters = {c for ca in chunk_analyses for c in ca.get("characters_found", ())}
+    all_locations = {l for ca in chunk_analyses for l in ca.get("locations_found", ())}
+    all_scenes = list(itertools.chain.from_iterable(ca.get("scenes", ()) for ca in chunk_analyses))
+    
+    prompt = f"""Total Pages: {total_pages}
+Total Scenes: {len(all_scenes)}
+Characters Found: {', '.join(list(all_characters)[:20])}
+Locations Found: {', '.join(list(all_locations)[:20])}
+
+Script Preview (first 1000 chars):
+{script_preview}
+"""
+    
+    response_text = await call_groq(prompt, max_tokens=4000, json_mode=True, system=SYNTHESIS_SYSTEM_PROMPT)
+    
+    try:
+        synthesis = orjson.loads(response_text)
         synthesis["scenes"] = all_scenes
         return synthesis
-    except json.JSONDecodeError as e:
+    except orjson.JSONDecodeError as e:
         raise HTTPException(
             status_code=500,
             detail=f"Failed to synthesize analysis: {str(e)}"
         )
 
-def analyze_script_with_groq(pages: List[str], page_count: int) -> dict:
+async def analyze_script_with_groq(pages: List[str], page_count: int) -> dict:
     """Main analysis function that handles chunking and synthesis"""
     
     chunks = chunk_pages(pages, pages_per_chunk=5)
     
     print(f"Processing {len(chunks)} chunks...")
     
-    chunk_analyses = []
-    for i, chunk in enumerate(chunks):
-        print(f"Analyzing chunk {i+1}/{len(chunks)}...")
-        analysis = analyze_chunk(chunk, i, len(chunks))
-        chunk_analyses.append(analysis)
+    semaphore = asyncio.Semaphore(CHUNK_CONCURRENCY)
+    
+    async def analyze_bounded(i: int, chunk: Dict[str, Any]) -> dict:
+        async with semaphore:
+            print(f"Analyzing chunk {i+1}/{len(chunks)}...")
+            return await analyze_chunk(chunk, i, len(chunks))
+    
+    chunk_analyses = await asyncio.gather(
+        *(analyze_bounded(i, chunk) for i, chunk in enumerate(chunks))
+    )
     
-    script_preview = "\n\n".join(pages[:2])  
+    script_preview = (pages[0] + "\n\n" + (pages[1] if len(pages) > 1 else ""))[:1000]
     
     print("Synthesizing final analysis...")
-    final_analysis = synthesize_analysis(chunk_analyses, page_count, script_preview)
+    final_analysis = await synthesize_analysis(chunk_analyses, page_count, script_preview)
     
     return final_analysis
 
+def sse_event(event: str, data: Any) -> bytes:
+    return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+async def stream_script_analysis(pages: List[str], page_count: int):
+    """Server-sent events: each chunk's scenes as soon as that chunk is extracted, then the final analysis"""
+    chunks = chunk_pages(pages, pages_per_chunk=5)
+    semaphore = asyncio.Semaphore(CHUNK_CONCURRENCY)
+    
+    async def analyze_bounded(i: int, chunk: Dict[str, Any]):
+        async with semaphore:
+            return i, await analyze_chunk(chunk, i, len(chunks))
+    
+    tasks = [asyncio.ensure_future(analyze_bounded(i, chunk)) for i, chunk in enumerate(chunks)]
+    try:
+        chunk_analyses = [None] * len(chunks)
+        for next_done in asyncio.as_completed(tasks):
+            i, chunk_analysis = await next_done
+            chunk_analyses[i] = chunk_analysis
+            yield sse_event("chunk", {
+                "chunk": i + 1,
+                "total_chunks": len(chunks),
+                "start_page": chunks[i]["start_page"],
+                "end_page": chunks[i]["end_page"],
+                "scenes": chunk_analysis.get("scenes", [])
+            })
+        
+        script_preview = (pages[0] + "\n\n" + (pages[1] if len(pages) > 1 else ""))[:1000]
+        analysis = await synthesize_analysis(chunk_analyses, page_count, script_preview)
+        yield sse_event("analysis", ScriptAnalysis.model_validate(analysis).model_dump())
+    except Exception as e:
+        # Headers are already sent, so failures are reported in-band
+        yield sse_event("error", {"detail": getattr(e, "detail", str(e))})
+    finally:
+        for task in tasks:
+            task.cancel()
+
 # ============= SCREENPLAY GENERATOR FUNCTIONS =============
 
-def generate_screenplay_scene(
+SCENE_PROMPT = """You are a professional screenwriter. Write one screenplay scene in standard Hollywood format.
+
+Scene {scene_number}: {int_ext}. {location} - {time_of_day}
+Description: {description}
+Characters: {characters}
+Props: {props}
+Special Requirements: {special_requirements}
+
+Character details:
+{char_context}
+
+Format: scene heading in ALL CAPS (INT./EXT. LOCATION - TIME); present-tense, single-spaced action lines; character names CENTERED and IN CAPS before centered dialogue; (lowercase) parentheticals only when needed; standard spacing between elements.
+
+Include vivid action, natural character-appropriate dialogue, good pacing, and the props and special requirements woven in organically. Length: about {page_count} pages.
+
+Write ONLY the formatted scene, no explanations or commentary.
+
+SCREENPLAY SCENE:"""
+
+async def generate_screenplay_scene(
     scene: Scene, 
-    characters: List[Character],
+    char_index: Dict[str, Character],
     style: str = "standard"
 ) -> str:
     """Generate a fully formatted screenplay scene using AI"""
     
     char_info = []
     for char_name in scene.characters:
-        char = next((c for c in characters if c.name.lower() == char_name.lower()), None)
+        char = char_index.get(char_name.lower())
         if char:
             char_info.append(f"{char.name}: {char.role} - {char.description}")
     
     char_context = "\n".join(char_info) if char_info else "Characters present in scene"
     
-    prompt = f"""You are a professional screenwriter. Generate a complete screenplay scene in standard Hollywood format.
-
-SCENE INFORMATION:
-Scene Number: {scene.scene_number}
-Scene Heading: {scene.int_ext}. {scene.location} - {scene.time_of_day}
-Description: {scene.description}
-Characters: {', '.join(scene.characters)}
-Props: {', '.join(scene.props) if scene.props else 'None specified'}
-Special Requirements: {', '.join(scene.special_requirements) if scene.special_requirements else 'None'}
-
-CHARACTER DETAILS:
-{char_context}
-
-SCREENPLAY FORMAT RULES:
-1. Scene heading in ALL CAPS: INT./EXT. LOCATION - TIME
-2. Action lines in present tense, single-spaced
-3. Character names CENTERED and IN CAPS before dialogue
-4. Dialogue below character name, centered
-5. Parentheticals in (lowercase) when needed for tone/action
-6. Use proper spacing between elements
-
-Generate a complete scene with:
-- Vivid action description
-- Natural, character-appropriate dialogue
-- Proper scene flow and pacing
-- Include props and special requirements organically
-- Make it approximately {scene.page_count} pages worth of content
-
-Write ONLY the formatted screenplay scene. Do not include explanations or meta-commentary.
-
-SCREENPLAY SCENE:"""
-
-    response = client.chat.completions.create(
-        model="llama-3.3-70b-versatile",
+    prompt = SCENE_PROMPT.format_map({
+        "scene_number": scene.scene_number,
+        "int_ext": scene.int_ext,
+        "location": scene.location,
+        "time_of_day": scene.time_of_day,
+        "description": scene.description,
+        "characters": ", ".join(scene.characters),
+        "props": ", ".join(scene.props) if scene.props else "None specified",
+        "special_requirements": ", ".join(scene.special_requirements) if scene.special_requirements else "None",
+        "char_context": char_context,
+        "page_count": scene.page_count,
+    })
+
+    response = await client.chat.completions.create(
+        model=GROQ_MODEL,
         messages=[{"role": "user", "content": prompt}],
         temperature=0.7,
         max_tokens=2000
@@ -375,7 +567,7 @@ SCREENPLAY SCENE:"""
     
     return response.choices[0].message.content.strip()
 
-def generate_complete_screenplay(
+async def generate_complete_screenplay(
     analysis: ScriptAnalysis,
     scene_numbers: Optional[List[int]] = None,
     style: str = "standard"
@@ -387,28 +579,34 @@ def generate_complete_screenplay(
     if scene_numbers:
         scenes = [s for s in scenes if s.scene_number in scene_numbers]
     
-    screenplay_scenes = []
-    
-    print(f"Generating screenplay for {len(scenes)} scenes...")
+    char_index = {c.name.lower(): c for c in analysis.characters}
+    semaphore = asyncio.Semaphore(SCENE_CONCURRENCY)
     
-    for i, scene in enumerate(scenes, 1):
-        print(f"Writing scene {i}/{len(scenes)} (Scene #{scene.scene_number})...")
-        
-        screenplay_text = generate_screenplay_scene(scene, analysis.characters, style)
+    async def write_scene(i: int, scene: Scene) -> ScreenplayScene:
+        async with semaphore:
+            print(f"Writing scene {i}/{len(scenes)} (Scene #{scene.scene_number})...")
+            screenplay_text = await generate_screenplay_scene(scene, char_index, style)
         
         formatting_notes = f"Estimated page count: {scene.page_count}, "
         formatting_notes += f"Characters: {len(scene.characters)}, "
         formatting_notes += f"Complexity: {scene.complexity_score}/10"
         
-        screenplay_scenes.append(ScreenplayScene(
+        # Every field is built here from already-validated values, so skip revalidation
+        return ScreenplayScene.model_construct(
             scene_number=scene.scene_number,
             screenplay_text=screenplay_text,
             formatting_notes=formatting_notes
-        ))
+        )
+    
+    print(f"Generating screenplay for {len(scenes)} scenes...")
+    
+    screenplay_scenes = await asyncio.gather(
+        *(write_scene(i, scene) for i, scene in enumerate(scenes, 1))
+    )
     
     total_pages = sum(s.page_count for s in scenes)
     
-    return ScreenplayOutput(
+    return ScreenplayOutput.model_construct(
         title=analysis.script_title,
         scenes=screenplay_scenes,
         total_pages_estimated=int(total_pages),
@@ -418,39 +616,35 @@ def generate_complete_screenplay(
 def export_screenplay_to_text(screenplay: ScreenplayOutput) -> str:
     """Export screenplay to plain text format"""
     
-    output = []
-    output.append("=" * 60)
-    output.append(screenplay.title.upper().center(60))
-    output.append("=" * 60)
-    output.append("\n\n")
+    buf = io.StringIO()
+    buf.write("=" * 60 + "\n")
+    buf.write(screenplay.title.upper().center(60) + "\n")
+    buf.write("=" * 60 + "\n\n\n")
     
     for scene in screenplay.scenes:
-        output.append(scene.screenplay_text)
-        output.append("\n\n")
-        output.append("-" * 60)
-        output.append("\n\n")
+        buf.write(scene.screenplay_text)
+        buf.write("\n\n" + "-" * 60 + "\n\n")
     
-    output.append("\n")
-    output.append(f"END OF SCREENPLAY")
-    output.append(f"\nEstimated Total Pages: {screenplay.total_pages_estimated}")
-    output.append(f"\nTotal Scenes: {len(screenplay.scenes)}")
+    buf.write("\nEND OF SCREENPLAY\n\n")
+    buf.write(f"Estimated Total Pages: {screenplay.total_pages_estimated}\n\n")
+    buf.write(f"Total Scenes: {len(screenplay.scenes)}")
     
-    return "\n".join(output)
+    return buf.getvalue()
 
 def export_screenplay_to_fountain(screenplay: ScreenplayOutput) -> str:
     """Export screenplay to Fountain format"""
     
-    output = []
-    output.append(f"Title: {screenplay.title}")
-    output.append(f"Format: {screenplay.format_style}")
-    output.append(f"Estimated Pages: {screenplay.total_pages_estimated}")
-    output.append("\n===\n")
+    buf = io.StringIO()
+    buf.write(f"Title: {screenplay.title}\n")
+    buf.write(f"Format: {screenplay.format_style}\n")
+    buf.write(f"Estimated Pages: {screenplay.total_pages_estimated}\n")
+    buf.write("\n===\n\n")
     
     for scene in screenplay.scenes:
-        output.append(scene.screenplay_text)
-        output.append("\n\n")
+        buf.write(scene.screenplay_text)
+        buf.write("\n\n")
     
-    return "\n".join(output)
+    return buf.getvalue()
 
 # ============= API ENDPOINTS =============
 
@@ -468,49 +662,126 @@ def root():
 
 @app.get("/health")
 def health_check():
-    return {"status": "healthy", "ai_model": "llama-3.3-70b-versatile", "features": ["analysis", "screenplay_generation"]}
+    return {
+        "status": "healthy",
+        "ai_model": GROQ_MODEL,
+        "extraction_model": GROQ_EXTRACTION_MODEL,
+        "features": ["analysis", "screenplay_generation"]
+    }
 
-@app.post("/analyze-script-pdf", response_model=ScriptAnalysis)
-async def analyze_script_pdf(file: UploadFile = File(...)):
-    """Analyze a PDF script and extract production details"""
+async def cache_get(key: str) -> Optional[Any]:
+    if redis_client is None:
+        return None
+    try:
+        cached = await redis_client.get(key)
+    except redis.RedisError as e:
+        print(f"Redis GET failed for {key}: {e}")
+        return None
+    return orjson.loads(cached) if cached else None
+
+async def cache_set(key: str, value: Any, ttl_seconds: int) -> None:
+    if redis_client is None:
+        return
+    try:
+        await redis_client.setex(key, ttl_seconds, orjson.dumps(value))
+    except redis.RedisError as e:
+        print(f"Redis SETEX failed for {key}: {e}")
+
+def hash_pdf(pdf_file: BinaryIO) -> str:
+    """Content hash of an uploaded PDF, read in 1 MB blocks"""
+    pdf_file.seek(0)
+    digest = hashlib.blake2b(digest_size=20)
+    for block in iter(lambda: pdf_file.read(1 << 20), b""):
+        digest.update(block)
+    return digest.hexdigest()
+
+async def analyze_and_cache(key: str, pages: List[str], page_count: int) -> dict:
+    analysis = await analyze_script_with_groq(pages, page_count)
+    await cache_set(key, analysis, ANALYSIS_CACHE_TTL_SECONDS)
+    return analysis
+
+# Identical scripts already being analyzed share one set of Groq calls
+inflight_analyses: Dict[str, asyncio.Task] = {}
+
+async def analyze_script_shared(pages: List[str], page_count: int) -> dict:
+    """Return a cached analysis for this script, or run analyze_script_with_groq once for all concurrent callers"""
+    digest = hashlib.sha256(ANALYSIS_PROMPT_VERSION.encode())
+    for page in pages:
+        digest.update(page.encode())
+        digest.update(b"\f")
+    key = f"analysis:{digest.hexdigest()}"
+    
+    analysis = await cache_get(key)
+    if analysis is not None:
+        return analysis
+    
+    task = inflight_analyses.get(key)
+    if task is None:
+        task = asyncio.ensure_future(analyze_and_cache(key, pages, page_count))
+        inflight_analyses[key] = task
+        task.add_done_callback(lambda _: inflight_analyses.pop(key, None))
+    # Shield so one client disconnecting does not cancel the analysis for the others
+    return await asyncio.shield(task)
+
+async def load_pdf_pages(file: UploadFile) -> (List[str], int):
+    """Validate an uploaded PDF and return its page texts"""
     if not file.filename.endswith(".pdf"):
         raise HTTPException(status_code=400, detail="File must be a PDF")
     
-    pdf_bytes = await file.read()
-    pages, page_count = extract_text_from_pdf(BytesIO(pdf_bytes))
+    if file.size is not None and file.size > MAX_PDF_BYTES:
+        raise HTTPException(status_code=413, detail=f"PDF exceeds the {MAX_PDF_BYTES >> 20} MB upload limit")
     
-    if page_count == 0 or sum(len(p) for p in pages) < 100:
-        raise HTTPException(status_code=400, detail="PDF content too short or empty")
+    # Re-uploads of the same PDF reuse its extracted pages
+    pdf_key = f"pdf-text:{await asyncio.to_thread(hash_pdf, file.file)}"
+    cached = await cache_get(pdf_key)
+    if cached is not None:
+        pages, page_count = cached
+    else:
+        # Starlette has already spooled the upload to a temporary file; parse it in place
+        pages, page_count = await extract_pdf_pages(file.file)
+        await cache_set(pdf_key, [pages, page_count], PDF_CACHE_TTL_SECONDS)
     
-    analysis = analyze_script_with_groq(pages, page_count)
-    return ScriptAnalysis(**analysis)
+    if not pages or sum(len(p) for p in pages) < 100:
+        raise HTTPException(status_code=400, detail="PDF content too short or empty")
+    return pages, page_count
+
+@app.post("/analyze-script-pdf", response_model=ScriptAnalysis)
+async def analyze_script_pdf(file: UploadFile = File(...)):
+    """Analyze a PDF script and extract production details"""
+    pages, page_count = await load_pdf_pages(file)
+    analysis = await analyze_script_shared(pages, page_count)
+    # Validate once here; returning a Response skips FastAPI's second response_model pass
+    return ORJSONResponse(ScriptAnalysis.model_validate(analysis).model_dump())
+
+@app.post("/analyze-script-pdf/stream")
+async def analyze_script_pdf_stream(file: UploadFile = File(...)):
+    """Analyze a PDF script, streaming scenes per chunk as server-sent events before the final analysis"""
+    pages, page_count = await load_pdf_pages(file)
+    # An explicit identity encoding keeps GZipMiddleware from buffering the events
+    return StreamingResponse(
+        stream_script_analysis(pages, page_count),
+        media_type="text/event-stream",
+        headers={"Content-Encoding": "identity"}
+    )
 
 @app.post("/analyze-script-text", response_model=ScriptAnalysis)
-async def analyze_script_text(script_text: str):
+async def analyze_script_text(request: AnalyzeTextRequest):
     """Analyze a text script and extract production details"""
-    if len(script_text) < 100:
-        raise HTTPException(status_code=400, detail="Script text too short")
-    
-    words = script_text.split()
-    pages = []
-    for i in range(0, len(words), 250):
-        page_text = " ".join(words[i:i+250])
-        pages.append(page_text)
-    
+    pages = split_text_into_pages(request.script_text)
     page_count = len(pages)
-    analysis = analyze_script_with_groq(pages, page_count)
-    return ScriptAnalysis(**analysis)
+    analysis = await analyze_script_shared(pages, page_count)
+    return ORJSONResponse(ScriptAnalysis.model_validate(analysis).model_dump())
 
 @app.post("/generate-screenplay", response_model=ScreenplayOutput)
 async def generate_screenplay(analysis: ScriptAnalysis, request: ScreenplayRequest = ScreenplayRequest()):
     """Generate a formatted screenplay from analyzed script data"""
     try:
-        screenplay = generate_complete_screenplay(
+        screenplay = await generate_complete_screenplay(
             analysis=analysis,
             scene_numbers=request.scene_numbers,
             style=request.style
         )
-        return screenplay
+        return ORJSONResponse(screenplay.model_dump())
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Screenplay generation failed: {str(e)}")
 
@@ -518,7 +789,7 @@ async def generate_screenplay(analysis: ScriptAnalysis, request: ScreenplayReque
 async def generate_screenplay_text(analysis: ScriptAnalysis, request: ScreenplayRequest = ScreenplayRequest()):
     """Generate and export screenplay as plain text"""
     try:
-        screenplay = generate_complete_screenplay(
+        screenplay = await generate_complete_screenplay(
             analysis=analysis,
             scene_numbers=request.scene_numbers,
             style=request.style
@@ -531,7 +802,7 @@ async def generate_screenplay_text(analysis: ScriptAnalysis, request: Screenplay
 async def generate_screenplay_fountain(analysis: ScriptAnalysis, request: ScreenplayRequest = ScreenplayRequest()):
     """Generate and export screenplay in Fountain format"""
     try:
-        screenplay = generate_complete_screenplay(
+        screenplay = await generate_complete_screenplay(
             analysis=analysis,
             scene_numbers=request.scene_numbers,
             style=request.style
@@ -540,6 +811,31 @@ async def generate_screenplay_fountain(analysis: ScriptAnalysis, request: Screen
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Screenplay generation failed: {str(e)}")
 
+@app.on_event("startup")
+async def startup_event():
+    global http_client, client
+    http_client = httpx.AsyncClient(
+        http2=True,
+        timeout=60.0,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)
+    )
+    client = AsyncGroq(api_key=os.environ["GROQ_API_KEY"], http_client=http_client)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await http_client.aclose()
+    pdf_process_pool.shutdown()
+    if redis_client is not None:
+        await redis_client.aclose()
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # Multiple workers need the app as an import string; uvloop/httptools ship with uvicorn[standard]
+    uvicorn.run(
+        "screenplay:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop",
+        http="httptools",
+        workers=WEB_CONCURRENCY
+    )
\ No newline at end of file
@@ -1,19 +1,26 @@
 from fastapi import FastAPI, Form, HTTPException, Body
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 from pydantic import BaseModel, Field
 from typing import Dict, List, Any, Optional
+from datetime import datetime, timezone
 import asyncio
-import json
+import hashlib
 import logging
+import orjson
+import string
+import time
+from collections import OrderedDict
 import motor
-import requests
+import httpx
 import os
 from dotenv import load_dotenv
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import DuplicateKeyError
+import redis.asyncio as redis
 from fastapi.middleware.cors import CORSMiddleware
 
 # --- CONFIGURATION & SETUP ---
-app = FastAPI(title="AI Production Scheduling Server")
+app = FastAPI(title="AI Production Scheduling Server", default_response_class=ORJSONResponse)
 
 # Load environment variables
 load_dotenv()
@@ -22,19 +29,47 @@ DB_NAME = "production_scheduler"
 API_KEY = os.getenv("GEMINI_API_KEY")
 GEMINI_MODEL = "gemini-2.5-flash-preview-05-20"
 API_URL_BASE = f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:generateContent"
+# Output cap for the schedule JSON; thinking is disabled in the request so the whole cap goes to the answer
+GEMINI_MAX_OUTPUT_TOKENS = int(os.getenv("GEMINI_MAX_OUTPUT_TOKENS", "8192"))
+
+# Shared HTTP client so Gemini calls reuse pooled keep-alive connections
+HTTPX_CLIENT = httpx.AsyncClient(
+    http2=True,
+    timeout=60,
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)
+)
+
+# Redis response cache (optional; disabled when no Redis is configured)
+REDIS_URL = os.getenv("REDIS_URL") or (
+    f"redis://{os.getenv('REDIS_HOST')}:{os.getenv('REDIS_PORT', '6379')}" if os.getenv("REDIS_HOST") else None
+)
+SCHEDULE_CACHE_TTL_SECONDS = 3600
+redis_client = redis.from_url(REDIS_URL) if REDIS_URL else None
+
+# In-process LRU in front of Redis: key -> (expires_at, value)
+LOCAL_CACHE_SIZE = 128
+local_cache: "OrderedDict[str, tuple]" = OrderedDict()
 
 # Logging setup
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # MongoDB setup
+# Explicit pool bounds (prewarmed at startup) and zstd wire compression for large schedule documents
+MONGO_CLIENT_OPTIONS = {
+    "maxPoolSize": 50,
+    "minPoolSize": 10,
+    "serverSelectionTimeoutMS": 3000,
+    "waitQueueTimeoutMS": 2000,
+    "compressors": "zstd",
+}
 if MONGO_URL:
-    client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URL)
+    client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URL, **MONGO_CLIENT_OPTIONS)
     db = client[DB_NAME]
 else:
     # Use a print statement for debugging if connection is None
     print("MONGO_URL not found. Client may default to localhost:27017.")
-    client = motor.motor_asyncio.AsyncIOMotorClient()
+    client = motor.motor_asyncio.AsyncIOMotorClient(**MONGO_CLIENT_OPTIONS)
     db = client[DB_NAME]
 
 # CORS setup for frontend communication
@@ -71,33 +106,165 @@ async def db_insert_one(collection_name: str, document: Dict[str, Any]) -> Dict[
     document["_id"] = str(result.inserted_id)
     return document
 
-async def db_find_one(collection_name: str, query: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+async def db_find_one(
+    collection_name: str,
+    query: Dict[str, Any],
+    projection: Optional[Dict[str, Any]] = None,
+    sort: Optional[List[Any]] = None
+) -> Optional[Dict[str, Any]]:
     collection = db[collection_name]
-    document = await collection.find_one(query)
-    if document:
+    document = await collection.find_one(query, projection, sort=sort)
+    if document and "_id" in document:
         document["_id"] = str(document["_id"])
     return document
 
-async def db_find(collection_name: str, query: Dict[str, Any]) -> List[Dict[str, Any]]:
-    collection = db[collection_name]
-    results = []
-    async for doc in collection.find(query):
-        doc["_id"] = str(doc["_id"])
-        results.append(doc)
-    return results
+async def db_find(
+    collection_name: str,
+    query: Dict[str, Any],
+    projection: Optional[Dict[str, Any]] = None,
+    limit: int = 0,
+    batch_size: int = 100
+) -> List[Dict[str, Any]]:
+    cursor = db[collection_name].find(query, projection).batch_size(batch_size)
+    documents = await cursor.to_list(length=limit or None)
+    for doc in documents:
+        if "_id" in doc:
+            doc["_id"] = str(doc["_id"])
+    return documents
+
+# --- SCHEDULE LOG WRITER ---
+# Generated schedules are logged off the request path and written in batches.
+
+SCHEDULE_LOG_BATCH_SIZE = 100
+SCHEDULE_LOG_FLUSH_SECONDS = 0.5
+schedule_log_queue: "asyncio.Queue[Optional[Dict[str, Any]]]" = asyncio.Queue()
+schedule_log_task: Optional[asyncio.Task] = None
+# Latest queued-but-unwritten log per (project_id, day_number), so history reads see it before the flush
+pending_schedule_logs: Dict[tuple, Dict[str, Any]] = {}
+
+def queue_schedule_log(schedule_log: Dict[str, Any]) -> None:
+    pending_schedule_logs[(schedule_log["project_id"], schedule_log["day_number"])] = schedule_log
+    schedule_log_queue.put_nowait(schedule_log)
+
+async def flush_schedule_logs(batch: List[Dict[str, Any]]) -> None:
+    try:
+        await db["daily_schedules"].insert_many(batch, ordered=False)
+    except Exception as e:
+        logger.error(f"Failed to write {len(batch)} schedule logs: {e}")
+    finally:
+        for log in batch:
+            key = (log["project_id"], log["day_number"])
+            # A newer log for the same day may have been queued meanwhile; leave that one pending
+            if pending_schedule_logs.get(key) is log:
+                del pending_schedule_logs[key]
+
+async def schedule_log_writer() -> None:
+    """Drains the log queue, flushing every 100 logs or 500 ms; a None item stops the writer."""
+    loop = asyncio.get_running_loop()
+    stopping = False
+    while not stopping:
+        item = await schedule_log_queue.get()
+        if item is None:
+            break
+        batch = [item]
+        deadline = loop.time() + SCHEDULE_LOG_FLUSH_SECONDS
+        while len(batch) < SCHEDULE_LOG_BATCH_SIZE:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(schedule_log_queue.get(), remaining)
+            except asyncio.TimeoutError:
+                break
+            if item is None:
+                stopping = True
+                break
+            batch.append(item)
+        await flush_schedule_logs(batch)
+
+# --- CACHE UTILITY FUNCTIONS ---
+
+def schedule_cache_key(
+    project_id: str,
+    day_number: int,
+    delay_hours: int,
+    script_text: str,
+    teams: List[Dict[str, Any]],
+    planned_focus: Any
+) -> str:
+    """Builds the cache key for a generated schedule from everything that feeds the prompt."""
+    digest = hashlib.sha1(script_text.encode())
+    digest.update(f"\n{planned_focus}".encode())
+    for t in teams:
+        digest.update(f"\n{t['team_name']}|{t['department']}|{t['lead_name']}".encode())
+    return f"sched:{project_id}:{day_number}:{delay_hours}:{digest.hexdigest()[:16]}"
+
+def local_cache_get(key: str) -> Optional[Any]:
+    entry = local_cache.get(key)
+    if entry is None:
+        return None
+    expires_at, value = entry
+    if expires_at < time.monotonic():
+        del local_cache[key]
+        return None
+    local_cache.move_to_end(key)
+    return value
+
+def local_cache_set(key: str, value: Any, ttl_seconds: int) -> None:
+    local_cache[key] = (time.monotonic() + ttl_seconds, value)
+    local_cache.move_to_end(key)
+    if len(local_cache) > LOCAL_CACHE_SIZE:
+        local_cache.popitem(last=False)
+
+async def cache_get(key: str) -> Optional[Any]:
+    value = local_cache_get(key)
+    if value is not None or redis_client is None:
+        return value
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            cached, ttl_seconds = await pipe.get(key).ttl(key).execute()
+    except redis.RedisError as e:
+        logger.warning(f"Redis GET failed for {key}: {e}")
+        return None
+    if not cached:
+        return None
+    value = orjson.loads(cached)
+    # Keep the local copy only as long as the Redis entry has left, so the two tiers expire together
+    if ttl_seconds > 0:
+        local_cache_set(key, value, ttl_seconds)
+    return value
+
+async def cache_set(key: str, value: Any, ttl_seconds: int) -> None:
+    local_cache_set(key, value, ttl_seconds)
+    if redis_client is None:
+        return
+    try:
+        await redis_client.setex(key, ttl_seconds, orjson.dumps(value))
+    except redis.RedisError as e:
+        logger.warning(f"Redis SETEX failed for {key}: {e}")
+
+# Identical requests already waiting on the AI share one upstream call
+inflight_schedules: Dict[str, asyncio.Task] = {}
+
+async def single_flight(key: str, coro_fn) -> Any:
+    task = inflight_schedules.get(key)
+    if task is None:
+        task = asyncio.ensure_future(coro_fn())
+        inflight_schedules[key] = task
+        task.add_done_callback(lambda _: inflight_schedules.pop(key, None))
+    # Shield so one caller disconnecting does not cancel the call for the others
+    return await asyncio.shield(task)
 
 # --- AI CALL FUNCTION ---
 
 async def call_gemini_api(payload: Dict[str, Any]) -> Optional[str]:
     """Calls the Gemini API with retries and a focus on JSON output."""
     try:
-        response = await asyncio.to_thread(
-            lambda: requests.post(
-                API_URL_BASE,
-                headers={'Content-Type': 'application/json'},
-                json=payload,
-                params={'key': API_KEY}
-            )
+        response = await HTTPX_CLIENT.post(
+            API_URL_BASE,
+            headers={'Content-Type': 'application/json'},
+            json=payload,
+            params={'key': API_KEY}
         )
         response.raise_for_status()
         result = response.json()
@@ -107,7 +274,7 @@ async def call_gemini_api(payload: Dict[str, Any]) -> Optional[str]:
         text = candidate.get('content', {}).get('parts', [{}])[0].get('text')
         
         return text
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"Gemini API network error: {e}")
         return None
     except Exception as e:
@@ -116,6 +283,26 @@ async def call_gemini_api(payload: Dict[str, Any]) -> Optional[str]:
 
 # --- CORE AI SCHEDULING LOGIC ---
 
+# Built once at import; only the day, project and delay are substituted per request
+SYSTEM_PROMPT_TEMPLATE = string.Template("""
+You are an AI Assistant Director and Production Manager. Your task is to generate a comprehensive, actionable, time-blocked schedule for **EACH** team for **Shooting Day $day_number** of the project "$project_id".
+
+The goal is to provide specific tasks, times, and goals for each team based on the script, the planned schedule, and the current delay.
+
+--- CONSTRAINTS ---
+1. **Timeframe:** The shoot day is 12 hours (e.g., 8:00 AM to 8:00 PM), with 1 hour for lunch (1:00 PM to 2:00 PM).
+2. **Delay Adjustment:** The production is currently **$delay_hours hours behind schedule**. Integrate tasks like "catch-up" or "prep for next day" to mitigate this delay.
+3. **Output Format:** You MUST return a single JSON object. The keys of this object MUST be the exact team names. The value for each team MUST be a list of tasks with 'time' and 'task' fields.
+
+--- EXAMPLE JSON OUTPUT ---
+{
+    "Production Team": [
+        {"time": "8:00 AM", "task": "Call Time & Safety Briefing"},
+        // ... more tasks
+    ]
+}
+""")
+
 async def generate_daily_schedules(
     project_id: str, 
     day_number: int, 
@@ -137,24 +324,11 @@ async def generate_daily_schedules(
     planned_focus = initial_plan.get(day_key, "No specific plan found in initial schedule.")
     
     # 3. Construct System Prompt (Crucial for structured output)
-    system_prompt = f"""
-    You are an AI Assistant Director and Production Manager. Your task is to generate a comprehensive, actionable, time-blocked schedule for **EACH** team for **Shooting Day {day_number}** of the project "{project_id}".
-
-    The goal is to provide specific tasks, times, and goals for each team based on the script, the planned schedule, and the current delay.
-
-    --- CONSTRAINTS ---
-    1. **Timeframe:** The shoot day is 12 hours (e.g., 8:00 AM to 8:00 PM), with 1 hour for lunch (1:00 PM to 2:00 PM).
-    2. **Delay Adjustment:** The production is currently **{delay_hours} hours behind schedule**. Integrate tasks like "catch-up" or "prep for next day" to mitigate this delay.
-    3. **Output Format:** You MUST return a single JSON object. The keys of this object MUST be the exact team names. The value for each team MUST be a list of tasks with 'time' and 'task' fields.
-    
-    --- EXAMPLE JSON OUTPUT ---
-    {{
-        "Production Team": [
-            {{"time": "8:00 AM", "task": "Call Time & Safety Briefing"}},
-            // ... more tasks
-        ]
-    }}
-    """
+    system_prompt = SYSTEM_PROMPT_TEMPLATE.substitute(
+        day_number=day_number,
+        project_id=project_id,
+        delay_hours=delay_hours
+    )
     
     # 4. Construct User Query
     user_query = f"""
@@ -177,7 +351,15 @@ async def generate_daily_schedules(
     
     payload = {
         "contents": [{"parts": [{"text": user_query}]}],
-        "systemInstruction": {"parts": [{"text": system_prompt}]}
+        "systemInstruction": {"parts": [{"text": system_prompt}]},
+        # JSON mode: no markdown fences or preamble to strip, and a bounded response
+        "generationConfig": {
+            "responseMimeType": "application/json",
+            "temperature": 0.2,
+            "maxOutputTokens": GEMINI_MAX_OUTPUT_TOKENS,
+            # 2.5 Flash thinks by default and thinking tokens count against maxOutputTokens
+            "thinkingConfig": {"thinkingBudget": 0}
+        }
     }
 
     ai_response_text = await call_gemini_api(payload)
@@ -186,11 +368,8 @@ async def generate_daily_schedules(
         raise ValueError("AI failed to generate a schedule or API key is missing.")
 
     try:
-        # Attempt to parse the AI's response as JSON
-        # Gemini often wraps JSON in markdown, so we try to clean it
-        cleaned_response = ai_response_text.strip().replace("```json", "").replace("```", "").strip()
-        return json.loads(cleaned_response)
-    except json.JSONDecodeError:
+        return orjson.loads(ai_response_text)
+    except orjson.JSONDecodeError:
         logger.error(f"Failed to parse AI JSON response: {ai_response_text}")
         raise ValueError("AI returned an unparsable schedule format.")
 
@@ -202,24 +381,22 @@ async def add_team(team_input: TeamInput):
     
     team_data = team_input.model_dump()
     
-    # Check for duplicates before insertion
-    existing = await db_find_one("teams", {"project_id": team_data["project_id"], "team_name": team_data["team_name"]})
-    if existing:
+    # Duplicates are rejected by the unique (project_id, team_name) index
+    try:
+        doc = await db_insert_one("teams", team_data)
+    except DuplicateKeyError:
         raise HTTPException(status_code=400, detail=f"Team '{team_data['team_name']}' already exists for this project.")
-
-    doc = await db_insert_one("teams", team_data)
     return {"message": f"Team added: {doc['team_name']} ({doc['department']})", "team_id": doc['_id']}
 
 @app.post("/script/upload/", summary="2. Upload Script and Initial Schedule")
 async def upload_script(script_input: ScriptInput):
     """Uploads the full script and the initial planned schedule for comparison."""
     
-    # Check if a script already exists for this project (we only expect one per project)
-    existing = await db_find_one("scripts", {"project_id": script_input.project_id})
-    if existing:
+    # Only one script per project; enforced by the unique project_id index
+    try:
+        doc = await db_insert_one("scripts", script_input.model_dump())
+    except DuplicateKeyError:
         raise HTTPException(status_code=400, detail="Script already exists. Use PUT or DELETE to modify/replace.")
-
-    doc = await db_insert_one("scripts", script_input.model_dump())
     return {"message": f"Script and initial schedule uploaded for {script_input.project_id}", "script_id": doc['_id']}
 
 @app.post("/schedule/generate/", summary="3. Generate Daily Team Schedules")
@@ -229,32 +406,53 @@ async def generate_schedule(schedule_request: ScheduleRequest):
     project_id = schedule_request.project_id
     day_number = schedule_request.day_number
 
-    # 1. Fetch Teams
-    teams = await db_find("teams", {"project_id": project_id})
+    # 1-3. Fetch Teams, Script/Initial Plan and Current Status/Delay concurrently
+    # The 'production_status' collection would be updated by the logging server to track actual progress.
+    # We assume a single document with the delay value.
+    teams, script_doc, status_doc = await asyncio.gather(
+        db_find(
+            "teams",
+            {"project_id": project_id},
+            projection={"team_name": 1, "department": 1, "lead_name": 1, "_id": 0}
+        ),
+        db_find_one(
+            "scripts",
+            {"project_id": project_id},
+            projection={"script_text": 1, "initial_planned_schedule": 1, "_id": 0}
+        ),
+        db_find_one(
+            "production_status",
+            {"project_id": project_id},
+            projection={"cumulative_delay_hours": 1, "_id": 0}
+        ),
+    )
     if not teams:
         raise HTTPException(status_code=404, detail="No teams found for this project. Please add teams first.")
-
-    # 2. Fetch Script and Initial Plan
-    script_doc = await db_find_one("scripts", {"project_id": project_id})
     if not script_doc:
         raise HTTPException(status_code=404, detail="Script and initial schedule not found. Please upload them first.")
-    
-    # 3. Fetch Current Status/Delay
-    # The 'production_status' collection would be updated by the logging server to track actual progress.
-    # We assume a single document with the delay value.
-    status_doc = await db_find_one("production_status", {"project_id": project_id})
     delay_hours = status_doc.get("cumulative_delay_hours", 0) if status_doc else 0
 
     try:
-        # Call the core AI scheduling function
-        team_schedules = await generate_daily_schedules(
-            project_id=project_id,
-            day_number=day_number,
-            script_text=script_doc["script_text"],
-            teams=teams,
-            delay_hours=delay_hours,
-            initial_plan=script_doc.get("initial_planned_schedule", {})
+        # Reuse an identical schedule generated recently, otherwise call the AI
+        initial_plan = script_doc.get("initial_planned_schedule", {})
+        cache_key = schedule_cache_key(
+            project_id, day_number, delay_hours, script_doc["script_text"], teams,
+            initial_plan.get(f"day_{day_number}")
         )
+        team_schedules = await cache_get(cache_key)
+        if team_schedules is None:
+            async def generate_and_cache():
+                result = await generate_daily_schedules(
+                    project_id=project_id,
+                    day_number=day_number,
+                    script_text=script_doc["script_text"],
+                    teams=teams,
+                    delay_hours=delay_hours,
+                    initial_plan=initial_plan
+                )
+                await cache_set(cache_key, result, SCHEDULE_CACHE_TTL_SECONDS)
+                return result
+            team_schedules = await single_flight(cache_key, generate_and_cache)
         
         # 4. Save the generated schedule (for historical tracking and frontend comparison)
         schedule_log = {
@@ -262,9 +460,10 @@ async def generate_schedule(schedule_request: ScheduleRequest):
             "day_number": day_number,
             "delay_hours": delay_hours,
             "generated_schedules": team_schedules,
-            "timestamp": str(db.client.admin.server_info()['localTime']),
+            "initial_planned_focus": initial_plan.get(f"day_{day_number}", "Plan not detailed."),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
         }
-        await db_insert_one("daily_schedules", schedule_log)
+        queue_schedule_log(schedule_log)
 
         return {"day_number": day_number, "delay_hours": delay_hours, "schedules": team_schedules}
 
@@ -276,17 +475,29 @@ async def generate_schedule(schedule_request: ScheduleRequest):
 async def get_schedule_history(project_id: str, day_number: int):
     """Retrieves the last generated schedule for a specific day number."""
     
-    schedule_doc = await db_find_one(
-        "daily_schedules", 
-        {"project_id": project_id, "day_number": day_number}
-    )
+    # A schedule generated moments ago may still be waiting for the batched writer
+    schedule_doc = pending_schedule_logs.get((project_id, day_number))
+    if schedule_doc is None:
+        # The initial plan for the day is stored on the schedule log itself for frontend comparison
+        schedule_doc = await db_find_one(
+            "daily_schedules", 
+            {"project_id": project_id, "day_number": day_number},
+            projection={"delay_hours": 1, "generated_schedules": 1, "initial_planned_focus": 1, "_id": 0},
+            sort=[("_id", -1)]
+        )
 
     if not schedule_doc:
         raise HTTPException(status_code=404, detail=f"No generated schedule found for Day {day_number}.")
 
-    # Fetch initial plan for frontend comparison
-    script_doc = await db_find_one("scripts", {"project_id": project_id})
-    initial_plan = script_doc.get("initial_planned_schedule", {}).get(f"day_{day_number}", "Plan not detailed.")
+    initial_plan = schedule_doc.get("initial_planned_focus")
+    if initial_plan is None:
+        # Logs written before the focus was stored on them: read the plan from the script
+        script_doc = await db_find_one(
+            "scripts",
+            {"project_id": project_id},
+            projection={f"initial_planned_schedule.day_{day_number}": 1, "_id": 0}
+        )
+        initial_plan = (script_doc or {}).get("initial_planned_schedule", {}).get(f"day_{day_number}", "Plan not detailed.")
 
     return {
         "day_number": day_number,
@@ -306,4 +517,34 @@ async def update_delay(project_id: str = Form(...), cumulative_delay_hours: int
         {"$set": {"cumulative_delay_hours": cumulative_delay_hours}},
         upsert=True
     )
-    return {"message": f"Delay status updated for {project_id}. Current delay: {cumulative_delay_hours} hours."}
\ No newline at end of file
+    return {"message": f"Delay status updated for {project_id}. Current delay: {cumulative_delay_hours} hours."}
+
+
+@app.on_event("startup")
+async def prewarm_mongo():
+    """Opens the Mongo connection pool before the first request arrives."""
+    await client.admin.command("ping")
+
+@app.on_event("startup")
+async def ensure_indexes():
+    """Creates the indexes backing every hot query (and the uniqueness checks)."""
+    await db["teams"].create_index([("project_id", 1), ("team_name", 1)], unique=True)
+    await db["scripts"].create_index("project_id", unique=True)
+    await db["daily_schedules"].create_index([("project_id", 1), ("day_number", 1), ("_id", -1)])
+    await db["production_status"].create_index("project_id", unique=True)
+
+@app.on_event("startup")
+async def start_schedule_log_writer():
+    global schedule_log_task
+    schedule_log_task = asyncio.create_task(schedule_log_writer())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Flush any queued schedule logs before the Mongo client goes away
+    if schedule_log_task is not None:
+        schedule_log_queue.put_nowait(None)
+        await schedule_log_task
+    await HTTPX_CLIENT.aclose()
+    if redis_client is not None:
+        await redis_client.aclose()
+    client.close()
@@ -1,44 +1,200 @@
 import os
 import re
-import json
-from io import BytesIO
-from typing import List, Union, Optional
-from fastapi import FastAPI, UploadFile, File, HTTPException
+import asyncio
+import hashlib
+import multiprocessing
+import time
+from collections import OrderedDict, deque
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Optional, BinaryIO
+from fastapi import FastAPI, UploadFile, File, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
-import PyPDF2
-from groq import Groq
-
-app = FastAPI(title="Script Analyzer AI", version="1.0.0")
-client = Groq(api_key="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")
+import httpx
+import orjson
+import pymupdf
+from dotenv import load_dotenv
+from groq import AsyncGroq
+
+load_dotenv()
+
+app = FastAPI(title="Script Analyzer AI", version="1.0.0", default_response_class=ORJSONResponse)
+# One pooled HTTP/2 connection set for every request, so the director, costume and all
+# cinematographer chunk calls multiplex over warm connections instead of new TLS handshakes
+http_client = httpx.AsyncClient(
+    http2=True,
+    timeout=120.0,
+    limits=httpx.Limits(max_connections=32, max_keepalive_connections=16)
+)
+client = AsyncGroq(
+    api_key=os.environ["GROQ_API_KEY"],
+    timeout=120.0,
+    # The SDK retries 429s and connection errors with jittered exponential backoff (honouring Retry-After)
+    max_retries=5,
+    http_client=http_client
+)
 
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True, 
                    allow_methods=["*"], allow_headers=["*"])
 
+MAX_PDF_BYTES = 50 << 20
+
+# JSON mode already guarantees the shape of the role analyses, so full Pydantic validation of
+# hundreds of nested scenes/shots is opt-in (set VALIDATE_LLM_OUTPUT=1 when debugging prompts)
+VALIDATE_LLM_OUTPUT = os.getenv("VALIDATE_LLM_OUTPUT", "").lower() in ("1", "true", "yes")
+
+# PDFs with at least this many pages are extracted in page ranges across worker processes
+PARALLEL_PDF_MIN_PAGES = 20
+PDF_WORKERS = os.cpu_count() or 1
+# Spawned, not forked: forking while a MuPDF producer thread is mid-extraction would copy its
+# half-updated library state into every worker
+pdf_process_pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+# Plain-text extraction only: never decode image blocks, and keep MuPDF's default whitespace handling
+PAGE_TEXT_FLAGS = pymupdf.TEXTFLAGS_TEXT & ~pymupdf.TEXT_PRESERVE_IMAGES
+
 # Shared Utilities
-def extract_text_from_pdf(pdf_file: BytesIO) -> tuple:
-    pdf_reader = PyPDF2.PdfReader(pdf_file)
-    text = "\n\n".join(p.extract_text() for p in pdf_reader.pages if p.extract_text())
-    return text, len(pdf_reader.pages)
-
-def call_groq(prompt: str, max_tokens: int = 8000) -> str:
-    response = client.chat.completions.create(
-        model="llama-3.3-70b-versatile",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.3,
-        max_tokens=max_tokens
-    )
-    return response.choices[0].message.content
+def read_upload(pdf_file: BinaryIO) -> bytes:
+    # The spooled upload has no path on disk, so MuPDF gets its bytes
+    pdf_file.seek(0)
+    return pdf_file.read()
+
+def count_pdf_pages(pdf_bytes: bytes) -> int:
+    with pymupdf.open(stream=pdf_bytes, filetype="pdf") as doc:
+        return len(doc)
+
+def iter_pdf_pages(pdf_bytes: bytes):
+    with pymupdf.open(stream=pdf_bytes, filetype="pdf") as doc:
+        for page in doc:
+            yield page.get_text("text", flags=PAGE_TEXT_FLAGS)
+
+def extract_page_range(pdf_bytes: bytes, start: int, end: int) -> List[str]:
+    """Extract the text of pages [start, end); runs inside a worker process"""
+    with pymupdf.open(stream=pdf_bytes, filetype="pdf") as doc:
+        return [doc[i].get_text("text", flags=PAGE_TEXT_FLAGS) for i in range(start, end)]
+
+# Page texts of recently uploaded PDFs keyed by content hash, so retried uploads skip extraction
+PDF_CACHE_SIZE = 32
+_pdf_cache: "OrderedDict[str, List[str]]" = OrderedDict()
+
+def pdf_digest(pdf_bytes: bytes) -> str:
+    return hashlib.blake2b(pdf_bytes, digest_size=16).hexdigest()
+
+async def stream_pdf_pages(pdf_file: BinaryIO):
+    """Yield page texts in order, from the cache for a previously seen PDF or as extraction proceeds"""
+    pdf_bytes = await asyncio.to_thread(read_upload, pdf_file)
+    digest = await asyncio.to_thread(pdf_digest, pdf_bytes)
+    cached = _pdf_cache.get(digest)
+    if cached is not None:
+        _pdf_cache.move_to_end(digest)
+        for text in cached:
+            yield text
+        return
+
+    pages = []
+    async for text in extract_pdf_pages(pdf_bytes):
+        pages.append(text)
+        yield text
+    # Only fully extracted documents are cached
+    _pdf_cache[digest] = pages
+    if len(_pdf_cache) > PDF_CACHE_SIZE:
+        _pdf_cache.popitem(last=False)
+
+async def extract_pdf_pages(pdf_bytes: bytes):
+    """Yield page texts in order while the rest of the PDF is still being extracted"""
+    loop = asyncio.get_running_loop()
+    total_pages = await asyncio.to_thread(count_pdf_pages, pdf_bytes)
+
+    # MuPDF must not be used from several threads at once, so large PDFs fan out over processes
+    if total_pages >= PARALLEL_PDF_MIN_PAGES and PDF_WORKERS > 1:
+        step = -(-total_pages // PDF_WORKERS)
+        ranges = [
+            loop.run_in_executor(pdf_process_pool, extract_page_range, pdf_bytes, start, min(start + step, total_pages))
+            for start in range(0, total_pages, step)
+        ]
+        try:
+            for page_range in ranges:
+                for text in await page_range:
+                    yield text
+        finally:
+            for page_range in ranges:
+                page_range.cancel()
+        return
+
+    queue = asyncio.Queue()
 
-def extract_json(text: str) -> str:
-    match = re.search(r'```(?:json)?\s*(\{.*\})\s*```', text, re.DOTALL)
-    if match: return match.group(1)
-    match = re.search(r'\{.*\}', text, re.DOTALL)
-    return match.group(0) if match else text
+    def produce():
+        try:
+            for text in iter_pdf_pages(pdf_bytes):
+                loop.call_soon_threadsafe(queue.put_nowait, text)
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, None)
+
+    producer = asyncio.ensure_future(asyncio.to_thread(produce))
+    while (text := await queue.get()) is not None:
+        yield text
+    await producer  # surfaces extraction errors
+
+# Groq calls in flight across all requests; size it to the account's rate-limit tier
+GROQ_CONCURRENCY = int(os.getenv("GROQ_CONCURRENCY", "8"))
+groq_semaphore = asyncio.Semaphore(GROQ_CONCURRENCY)
+
+# Opt-in per-minute request and token budgets; 0 disables each (the default)
+GROQ_RPM = int(os.getenv("GROQ_RPM", "0"))
+GROQ_TPM = int(os.getenv("GROQ_TPM", "0"))
+_rate_window: "deque[tuple]" = deque()  # (sent_at, estimated_tokens) of calls in the last minute
+_rate_lock = asyncio.Lock()
+
+async def wait_for_rate_limit(tokens: int):
+    """Delay until a call of ~tokens fits the rolling one-minute budget, instead of letting Groq 429 it"""
+    if not GROQ_RPM and not GROQ_TPM:
+        return
+    async with _rate_lock:
+        while True:
+            now = time.monotonic()
+            while _rate_window and now - _rate_window[0][0] >= 60:
+                _rate_window.popleft()
+            used = sum(sent for _, sent in _rate_window)
+            # A single call larger than the token budget is let through once the window is empty
+            if (not GROQ_RPM or len(_rate_window) < GROQ_RPM) and (not GROQ_TPM or not _rate_window or used + tokens <= GROQ_TPM):
+                _rate_window.append((now, tokens))
+                return
+            await asyncio.sleep(60 - (now - _rate_window[0][0]))
+
+async def call_groq(prompt: str, max_tokens: int = 8000, json_mode: bool = False) -> str:
+    extra = {"response_format": {"type": "json_object"}} if json_mode else {}
+    async with groq_semaphore:
+        await wait_for_rate_limit(len(prompt) // CHARS_PER_TOKEN + max_tokens)
+        response = await client.chat.completions.create(
+            model="llama-3.3-70b-versatile",
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.3,
+            max_tokens=max_tokens,
+            **extra
+        )
+    return response.choices[0].message.content
 
-def chunk_text(text: str, words_per_chunk=1250):
-    words = text.split()
-    return [" ".join(words[i:i+words_per_chunk]) for i in range(0, len(words), words_per_chunk)]
+WORD_RE = re.compile(r"\S+")
+# Rough screenplay density, used to turn chunk word counts into page estimates
+WORDS_PER_PAGE = 250
+
+def take_chunks(text: str, words_per_chunk=1250, final=False) -> tuple:
+    """Slice every full words_per_chunk-word chunk off the front of text at word offsets (no split/join).
+    Returns ([(chunk, word_count), ...], leftover); with final the leftover is emitted as a last chunk too."""
+    chunks = []
+    start = 0
+    words = 0
+    for words, match in enumerate(WORD_RE.finditer(text), 1):
+        if words > 1 and (words - 1) % words_per_chunk == 0:
+            chunks.append((text[start:match.start()].rstrip(), words_per_chunk))
+            start = match.start()
+    leftover = text[start:]
+    if final and leftover.strip():
+        chunks.append((leftover, words - words_per_chunk * len(chunks)))
+        leftover = ""
+    return chunks, leftover
 
 # Enhanced Models
 class BaseScene(BaseModel):
@@ -105,6 +261,7 @@ class DirectorAnalysis(BaseModel):
     budget_considerations: List[str]
     scheduling_recommendations: List[str]
     logistics_summary: dict  # {"total_travel_cost": "", "accommodation_nights": 0, "meal_budget": ""}
+    input_truncated: bool = False  # script was cut to fit the model context; its end was not analyzed
 
 class CameraScene(BaseScene):
     total_shots_estimated: int
@@ -148,6 +305,7 @@ class CameraAnalysis(BaseModel):
     post_production_breakdown: List[PostProductionBreakdown]
     total_post_production_budget: str
     vfx_summary: dict  # {"total_vfx_shots": 0, "vfx_percentage_of_project": 0, "estimated_vfx_budget": ""}
+    input_truncated: bool = False  # script was cut to fit the model context; its end was not analyzed
 
 class CostumeAnalysis(BaseModel):
     script_title: str
@@ -157,13 +315,15 @@ class CostumeAnalysis(BaseModel):
     scenes: List[dict]
     wardrobe_budget_estimate: str
     continuity_guidelines: List[str]
+    input_truncated: bool = False  # script was cut to fit the model context; its end was not analyzed
 
 class AllAnalysesResult(BaseModel):
     script_title: str
     total_pages: int
-    director_analysis: Optional[Union[DirectorAnalysis, dict]] = None
-    cinematographer_analysis: Optional[Union[CameraAnalysis, dict]] = None
-    costume_analysis: Optional[Union[CostumeAnalysis, dict]] = None
+    director_analysis: Optional[DirectorAnalysis] = None
+    cinematographer_analysis: Optional[CameraAnalysis] = None
+    costume_analysis: Optional[CostumeAnalysis] = None
+    errors: Optional[Dict[str, str]] = None  # role -> failure message, for roles that failed
 
 # Enhanced Prompts with Detailed Casting Instructions
 DIRECTOR_PROMPT = """Expert film director & production manager: analyze for comprehensive production planning with detailed budgeting and location analysis. Return JSON only:
@@ -401,186 +561,6 @@ IMPORTANT:
 
 Script: {script}"""
 
-CAMERA_PROMPT = """Expert cinematographer: analyze with detailed post-production requirements. Return JSON only:
-
-{{
-  "script_title": "",
-  "total_pages": {pages},
-  "total_scenes": 0,
-  "estimated_shoot_days": 0,
-  "overall_visual_style": "",
-  "cinematography_genre": "",
-  "aspect_ratio_recommendation": "",
-  "color_grading_approach": "",
-  "reference_films": [],
-  "scenes": [
-    {{
-      "scene_number": 0,
-      "scene_heading": "",
-      "int_ext": "",
-      "location": "",
-      "time_of_day": "",
-      "page_count": 0,
-      "description": "",
-      "total_shots_estimated": 0,
-      "primary_camera_positions": [],
-      "recommended_camera_package": "",
-      "lighting_approach": "",
-      "power_requirements": "",
-      "crew_size_recommendation": 0,
-      "gimbal_required": false,
-      "crane_dolly_required": false,
-      "drone_required": false,
-      "underwater_required": false,
-      "special_fps_required": "",
-      "color_temperature_notes": "",
-      "estimated_setup_time_minutes": 0,
-      "estimated_shoot_time_minutes": 0,
-      "technical_complexity_score": 0,
-      "post_production_requirements": {{
-        "editing_complexity": "Simple/Medium/Complex - explain why",
-        "vfx_shots": 0,
-        "vfx_complexity": "None/Basic/Medium/Complex - what type of VFX",
-        "color_grading_hours": 0,
-        "vfx_percentage": 0,
-        "vfx_description": "Detailed list of VFX needed (wire removal, compositing, CGI elements, etc.)",
-        "editing_notes": "Specific editing requirements (multicam, slow-mo, match cuts, etc.)"
-      }},
-      "estimated_post_budget": "₹X for this scene's post work"
-    }}
-  ],
-  "shots": [
-    {{
-      "shot_number": "",
-      "scene_number": 0,
-      "shot_type": "",
-      "shot_size": "",
-      "camera_angle": "",
-      "camera_movement": "",
-      "lens_focal_length": "",
-      "aperture_recommendation": "",
-      "frame_rate": "",
-      "stabilization_required": "",
-      "special_equipment": [],
-      "lighting_notes": "",
-      "composition_notes": "",
-      "estimated_setup_time_minutes": 0,
-      "estimated_shoot_time_minutes": 0,
-      "technical_difficulty": "",
-      "requires_vfx": false,
-      "vfx_notes": ""
-    }}
-  ],
-  "lighting_setups": [
-    {{
-      "scene_number": 0,
-      "location": "",
-      "time_of_day": "",
-      "lighting_style": "",
-      "key_lights": [],
-      "fill_lights": [],
-      "practical_lights": [],
-      "modifiers_needed": [],
-      "power_requirements": "",
-      "setup_complexity": "",
-      "estimated_setup_time_minutes": 0
-    }}
-  ],
-  "camera_equipment": {{
-    "camera_body": "",
-    "lenses_required": [],
-    "stabilization": [],
-    "specialty_rigs": [],
-    "filters_needed": [],
-    "justification": ""
-  }},
-  "camera_movements": [
-    {{
-      "movement_type": "",
-      "scenes": [],
-      "total_occurrences": 0,
-      "equipment_needed": "",
-      "crew_expertise_level": "",
-      "notes": ""
-    }}
-  ],
-  "visual_effects": [
-    {{
-      "effect_type": "",
-      "description": "",
-      "scenes": [],
-      "camera_requirements": "",
-      "pre_production_notes": "",
-      "on_set_requirements": "",
-      "post_production_notes": "",
-      "estimated_vfx_hours": 0,
-      "estimated_vfx_cost": ""
-    }}
-  ],
-  "post_production_breakdown": [
-    {{
-      "category": "Editing",
-      "total_hours_estimated": 0,
-      "complexity_level": "Basic/Intermediate/Advanced",
-      "estimated_cost": "₹X (₹Y per hour × Z hours)",
-      "percentage_of_total_post": 40,
-      "key_requirements": ["Multi-cam editing", "Color correction", "Sound sync"]
-    }},
-    {{
-      "category": "VFX",
-      "total_hours_estimated": 0,
-      "complexity_level": "",
-      "estimated_cost": "",
-      "percentage_of_total_post": 30,
-      "key_requirements": ["List specific VFX shots", "Green screen compositing", "Object removal"]
-    }},
-    {{
-      "category": "Color Grading",
-      "total_hours_estimated": 0,
-      "complexity_level": "",
-      "estimated_cost": "",
-      "percentage_of_total_post": 20,
-      "key_requirements": ["Cinematic look development", "Shot matching", "Style consistency"]
-    }},
-    {{
-      "category": "Sound Design & Mixing",
-      "total_hours_estimated": 0,
-      "complexity_level": "",
-      "estimated_cost": "",
-      "percentage_of_total_post": 10,
-      "key_requirements": ["ADR sessions", "Foley recording", "5.1 mixing"]
-    }}
-  ],
-  "total_post_production_budget": "₹X total for all post work",
-  "vfx_summary": {{
-    "total_vfx_shots": 0,
-    "vfx_percentage_of_project": 0,
-    "estimated_vfx_budget": "₹X",
-    "vfx_breakdown": {{
-      "compositing": "X shots, ₹Y",
-      "cgi_elements": "X shots, ₹Y",
-      "cleanup_removal": "X shots, ₹Y",
-      "motion_graphics": "X shots, ₹Y"
-    }},
-    "vfx_timeline": "X weeks for completion"
-  }},
-  "overall_technical_complexity": "",
-  "key_technical_challenges": [],
-  "pre_production_requirements": [],
-  "equipment_rental_budget_estimate": "",
-  "crew_recommendations": {{}},
-  "location_scouting_priorities": []
-}}
-
-IMPORTANT:
-- For each scene, calculate VFX percentage (shots requiring VFX / total shots × 100)
-- Estimate editing hours based on: basic scene = 4 hours, medium = 8 hours, complex = 16+ hours
-- Estimate VFX hours per shot: simple = 4-8 hours, medium = 16-32 hours, complex = 40+ hours
-- Calculate color grading: 2-4 hours per finished minute of footage
-- Provide specific cost estimates for Kerala/Indian post-production rates
-
-Script: {script}"""
-
 COSTUME_PROMPT = """Expert costume designer: analyze wardrobe needs. Return JSON only:
 {{"script_title":"","total_pages":{pages},"total_scenes":0,"characters":[{{"character_name":"",
 "character_age":0,"character_role":"","style_notes":"","color_palette":"","costume_count":0,
@@ -590,53 +570,397 @@ COSTUME_PROMPT = """Expert costume designer: analyze wardrobe needs. Return JSON
 "special_costume_considerations":[]}}
 Script: {script}"""
 
-def analyze_role(role: str, script: str, pages: int) -> dict:
-    prompts = {
-        "director": DIRECTOR_PROMPT,
-        "cinematographer": CAMERA_PROMPT,
-        "costume": COSTUME_PROMPT
-    }
-    prompt = prompts[role].format(pages=pages, script=script)
-    response = call_groq(prompt, max_tokens=8000)
-    return json.loads(extract_json(response))
-
-@app.post("/analyze-script-pdf", response_model=AllAnalysesResult)
-async def analyze_script_pdf(file: UploadFile = File(...)):
+# Map step of the cinematographer analysis: each script chunk only yields its scenes and shots
+CAMERA_CHUNK_PROMPT = """Expert cinematographer: break this script excerpt (~{pages} pages) into scenes and shots. Return JSON only:
+{{"scenes":[{{"scene_number":0,"scene_heading":"","int_ext":"","location":"","time_of_day":"","page_count":0,
+"description":"","total_shots_estimated":0,"primary_camera_positions":[],"recommended_camera_package":"",
+"lighting_approach":"","power_requirements":"","crew_size_recommendation":0,"gimbal_required":false,
+"crane_dolly_required":false,"drone_required":false,"underwater_required":false,"special_fps_required":"",
+"color_temperature_notes":"","estimated_setup_time_minutes":0,"estimated_shoot_time_minutes":0,
+"technical_complexity_score":0,"post_production_requirements":{{"editing_complexity":"","vfx_shots":0,
+"vfx_complexity":"","color_grading_hours":0,"vfx_percentage":0,"vfx_description":"","editing_notes":""}},
+"estimated_post_budget":"₹X for this scene's post work"}}],
+"shots":[{{"shot_number":"","scene_number":0,"shot_type":"","shot_size":"","camera_angle":"","camera_movement":"",
+"lens_focal_length":"","aperture_recommendation":"","frame_rate":"","stabilization_required":"","special_equipment":[],
+"lighting_notes":"","composition_notes":"","estimated_setup_time_minutes":0,"estimated_shoot_time_minutes":0,
+"technical_difficulty":"","requires_vfx":false,"vfx_notes":""}}]}}
+Use Kerala/Indian post-production rates. VFX percentage = shots requiring VFX / total shots × 100.
+Script: {script}"""
+
+# Reduce step: project-level fields from the scene list and the opening/closing pages
+CAMERA_SYNTHESIS_PROMPT = """Expert cinematographer: from this {pages}-page script's scene breakdown and its opening and closing pages,
+plan the production's cinematography and post-production. Return JSON only:
+{{"script_title":"","estimated_shoot_days":0,"overall_visual_style":"","cinematography_genre":"",
+"aspect_ratio_recommendation":"","color_grading_approach":"","reference_films":[],
+"lighting_setups":[{{"scene_number":0,"location":"","time_of_day":"","lighting_style":"","key_lights":[],"fill_lights":[],
+"practical_lights":[],"modifiers_needed":[],"power_requirements":"","setup_complexity":"","estimated_setup_time_minutes":0}}],
+"camera_equipment":{{"camera_body":"","lenses_required":[],"stabilization":[],"specialty_rigs":[],"filters_needed":[],"justification":""}},
+"camera_movements":[{{"movement_type":"","scenes":[],"total_occurrences":0,"equipment_needed":"","crew_expertise_level":"","notes":""}}],
+"visual_effects":[{{"effect_type":"","description":"","scenes":[],"camera_requirements":"","pre_production_notes":"",
+"on_set_requirements":"","post_production_notes":"","estimated_vfx_hours":0,"estimated_vfx_cost":""}}],
+"post_production_breakdown":[{{"category":"Editing/VFX/Color Grading/Sound Design & Mixing","total_hours_estimated":0,
+"complexity_level":"Basic/Intermediate/Advanced","estimated_cost":"₹X (₹Y per hour × Z hours)","percentage_of_total_post":0,
+"key_requirements":[]}}],
+"total_post_production_budget":"₹X total for all post work",
+"vfx_summary":{{"total_vfx_shots":0,"vfx_percentage_of_project":0,"estimated_vfx_budget":"₹X",
+"vfx_breakdown":{{"compositing":"X shots, ₹Y","cgi_elements":"X shots, ₹Y","cleanup_removal":"X shots, ₹Y","motion_graphics":"X shots, ₹Y"}},
+"vfx_timeline":"X weeks for completion"}},
+"overall_technical_complexity":"","key_technical_challenges":[],"pre_production_requirements":[],
+"equipment_rental_budget_estimate":"","crew_recommendations":{{}},"location_scouting_priorities":[]}}
+IMPORTANT:
+- One post_production_breakdown entry each for Editing, VFX, Color Grading and Sound Design & Mixing
+- Editing hours: basic scene = 4, medium = 8, complex = 16+; VFX hours per shot: simple = 4-8, medium = 16-32, complex = 40+
+- Color grading: 2-4 hours per finished minute of footage
+- Provide specific cost estimates for Kerala/Indian post-production rates
+Script: {script}"""
+
+SCHEMA_LINE_STARTS = ('{', '}', '[', ']', '"')
+
+def compact_prompt(template: str) -> str:
+    """Join the JSON-schema lines of a prompt into single lines with no indentation; prose lines are kept as is"""
+    lines = []
+    in_schema = False
+    for line in template.split("\n"):
+        stripped = line.strip()
+        is_schema = stripped.startswith(SCHEMA_LINE_STARTS)
+        if is_schema and in_schema:
+            lines[-1] += stripped
+        else:
+            lines.append(stripped if is_schema else line)
+        in_schema = is_schema
+    return "\n".join(lines)
+
+# The model needs the schema's shape, not its layout; indentation alone was hundreds of tokens per call
+DIRECTOR_PROMPT, CAMERA_CHUNK_PROMPT, CAMERA_SYNTHESIS_PROMPT, COSTUME_PROMPT = (
+    compact_prompt(DIRECTOR_PROMPT), compact_prompt(CAMERA_CHUNK_PROMPT),
+    compact_prompt(CAMERA_SYNTHESIS_PROMPT), compact_prompt(COSTUME_PROMPT)
+)
+
+def combine_prompts(templates: dict) -> str:
+    """One prompt asking for several role analyses of the same script, keyed by role"""
+    sections = [
+        f'=== "{key}" ===\n{template.rsplit("Script: {script}", 1)[0].strip()}'
+        for key, template in templates.items()
+    ]
+    keys = ", ".join(f'"{key}"' for key in templates)
+    return (f"Analyze the script below for each of these roles. Return JSON only: one object whose top-level keys are {keys}, "
+            "each holding that role's analysis exactly as its section specifies.\n\n" + "\n\n".join(sections) + "\n\nScript: {script}")
+
+# Opt-in: director and costume share one round-trip, which helps when calls are rate-limited
+# rather than latency-bound (the cinematographer keeps its chunked map-reduce)
+COMBINE_ROLE_CALLS = os.getenv("COMBINE_ROLE_CALLS", "").lower() in ("1", "true", "yes")
+DIRECTOR_COSTUME_PROMPT = combine_prompts({"director": DIRECTOR_PROMPT, "costume": COSTUME_PROMPT})
+
+CAMERA_CHUNK_MAX_TOKENS = 3000
+# Completion budgets for calls that differ from the 8000-token default
+ROLE_MAX_TOKENS = {"camera_chunk": CAMERA_CHUNK_MAX_TOKENS, "director_costume": 16000}
+# Opening and closing pages given to the synthesis call alongside the scene list
+CAMERA_EXCERPT_PAGES = 2
+
+def scene_key(scene: dict) -> tuple:
+    return scene.get("scene_number"), WHITESPACE_RE.sub(" ", str(scene.get("scene_heading") or "")).strip().upper()
+
+def collect_scenes_and_shots(chunk_analyses: List[dict]) -> tuple:
+    """Concatenate per-chunk scenes and shots in script order. A scene cut by a chunk boundary is often
+    reported by both chunks; when a chunk opens with the previous chunk's last scene (same number and heading),
+    that repeat and its shots already reported by the previous chunk are dropped."""
+    scenes, shots = [], []
+    previous_last, previous_shots = None, set()
+    for analysis in chunk_analyses:
+        chunk_scenes = analysis.get("scenes") or []
+        chunk_shots = analysis.get("shots") or []
+        repeated = None
+        if chunk_scenes and previous_last is not None and scene_key(chunk_scenes[0]) == previous_last:
+            repeated = previous_last[0]
+            chunk_scenes = chunk_scenes[1:]
+        scenes.extend(chunk_scenes)
+        for shot in chunk_shots:
+            key = (shot.get("scene_number"), shot.get("shot_number"))
+            if repeated is not None and key[0] == repeated and key in previous_shots:
+                continue
+            shots.append(shot)
+        if analysis.get("scenes"):
+            previous_last = scene_key(analysis["scenes"][-1])
+            previous_shots = {(shot.get("scene_number"), shot.get("shot_number")) for shot in chunk_shots}
+        else:
+            previous_last, previous_shots = None, set()
+    return scenes, shots
+
+def camera_breakdown(chunk_analyses: List[dict], parts: List[str]) -> str:
+    """Input for the synthesis call: scene headings, counts, and the first/last pages of the script"""
+    scenes, shots = collect_scenes_and_shots(chunk_analyses)
+    vfx_shots = sum(1 for shot in shots if shot.get("requires_vfx"))
+    lines = [f"Scenes: {len(scenes)}, shots: {len(shots)}, VFX shots: {vfx_shots}", "Scene headings:"]
+    lines += [f"{scene.get('scene_number', '?')}. {scene.get('scene_heading', '')}" for scene in scenes]
+    if len(parts) > 2 * CAMERA_EXCERPT_PAGES:
+        excerpts = [*parts[:CAMERA_EXCERPT_PAGES], "[...]", *parts[-CAMERA_EXCERPT_PAGES:]]
+    else:
+        excerpts = parts
+    return "\n".join(lines) + "\n\nOpening and closing pages:\n" + "\n\n".join(excerpts)
+
+def merge_camera_analyses(chunk_analyses: List[dict], synthesis: dict, pages: int) -> dict:
+    """Combine the per-chunk scenes/shots with the synthesized project-level fields"""
+    merged = dict(synthesis)
+    merged["scenes"], merged["shots"] = collect_scenes_and_shots(chunk_analyses)
+    merged["total_scenes"] = len(merged["scenes"])
+    merged["total_pages"] = pages
+    return merged
+
+# Scripts longer than this are condensed before the director sees them
+LONG_SCRIPT_WORDS = 15000
+SUMMARY_BLOCK_PAGES = 10
+SCENE_HEADING_RE = re.compile(r"^[ \t]*(?:INT\.|EXT\.|INT/EXT\.?|I/E\.?)[^\n]*", re.MULTILINE)
+
+SUMMARY_PROMPT = """Summarize pages {start}-{end} of a screenplay for a production breakdown.
+List the key characters (with age/gender hints and any described clothing), locations (INT/EXT, time of day), props, stunts and story events, in order.
+Be terse; plain text, no preamble.
+Pages:
+{text}"""
+
+async def condense_script(parts: List[str]) -> str:
+    """Director input for long scripts: every scene heading plus a summary of each 10-page block"""
+
+    async def summarize(start: int) -> str:
+        block = parts[start:start + SUMMARY_BLOCK_PAGES]
+        prompt = SUMMARY_PROMPT.format(start=start + 1, end=start + len(block), text="\n\n".join(block))
+        summary = await call_groq(prompt, max_tokens=1000)
+        return f"Pages {start + 1}-{start + len(block)}:\n{summary.strip()}"
+
+    summaries = await asyncio.gather(*(summarize(start) for start in range(0, len(parts), SUMMARY_BLOCK_PAGES)))
+    headings = [heading.strip() for part in parts for heading in SCENE_HEADING_RE.findall(part)]
+    return "Scene headings:\n" + "\n".join(headings) + "\n\nBlock summaries:\n" + "\n\n".join(summaries)
+
+# Parsed role analyses keyed by role, prompt version and script hash; bump the version when prompts change
+PROMPT_VERSION = "3"
+ROLE_CACHE_SIZE = 256
+_role_cache: "OrderedDict[str, dict]" = OrderedDict()
+WHITESPACE_RE = re.compile(r"\s+")
+
+def script_fingerprint(script: str) -> str:
+    """Hash of the script with whitespace collapsed, so re-exports that only reflow lines share a cache entry"""
+    return hashlib.sha256(WHITESPACE_RE.sub(" ", script).strip().encode()).hexdigest()
+
+# llama-3.3-70b context window, and a rough chars-per-token ratio for English screenplay text
+MODEL_CONTEXT_TOKENS = 128000
+CHARS_PER_TOKEN = 4
+
+ROLE_PROMPTS = {
+    "director": DIRECTOR_PROMPT,
+    "cinematographer": CAMERA_SYNTHESIS_PROMPT,
+    "camera_chunk": CAMERA_CHUNK_PROMPT,
+    "costume": COSTUME_PROMPT,
+    "director_costume": DIRECTOR_COSTUME_PROMPT
+}
+
+@lru_cache(maxsize=128)
+def prompt_parts(role: str, pages: int) -> tuple:
+    """(prefix, suffix) of a role prompt around {script}, formatted once per page count instead of per call"""
+    prefix, _, suffix = ROLE_PROMPTS[role].partition("{script}")
+    return prefix.format(pages=pages), suffix.format(pages=pages)
+
+def context_budget_chars(role: str, pages: int) -> int:
+    """Characters of script that fit beside the role's prompt and completion in the model context"""
+    prefix, suffix = prompt_parts(role, pages)
+    return (MODEL_CONTEXT_TOKENS - ROLE_MAX_TOKENS.get(role, 8000)) * CHARS_PER_TOKEN - len(prefix) - len(suffix)
+
+async def analyze_role(role: str, script: str, pages: int) -> dict:
+    cache_key = f"{role}:{PROMPT_VERSION}:{pages}:{script_fingerprint(script)}"
+    cached = _role_cache.get(cache_key)
+    if cached is not None:
+        _role_cache.move_to_end(cache_key)
+        return cached
+
+    max_tokens = ROLE_MAX_TOKENS.get(role, 8000)
+    prefix, suffix = prompt_parts(role, pages)
+    # Last resort only: whole-script roles are condensed before they get here when they would not fit
+    budget_chars = context_budget_chars(role, pages)
+    truncated = len(script) > budget_chars
+    if truncated:
+        print(f"{role}: script is ~{len(script) // CHARS_PER_TOKEN} tokens; truncating to ~{budget_chars // CHARS_PER_TOKEN} to fit the context window")
+    prompt = prefix + script[:budget_chars] + suffix
+    # JSON mode guarantees a bare object, so no fence or prose stripping is needed
+    response = await call_groq(prompt, max_tokens=max_tokens, json_mode=True)
+    analysis = orjson.loads(response)
+    if truncated:
+        analysis["input_truncated"] = True
+
+    _role_cache[cache_key] = analysis
+    if len(_role_cache) > ROLE_CACHE_SIZE:
+        _role_cache.popitem(last=False)
+    return analysis
+
+ROLES = ["director", "cinematographer", "costume"]
+ROLE_MODELS = {
+    "director": DirectorAnalysis,
+    "cinematographer": CameraAnalysis,
+    "costume": CostumeAnalysis
+}
+
+async def parse_and_dispatch(file: UploadFile) -> tuple:
+    """Extract the PDF's pages; returns (parts, script_text, page_count, camera_tasks)"""
     if not file.filename.endswith(".pdf"):
         raise HTTPException(400, "File must be PDF")
     
-    script_text, page_count = extract_text_from_pdf(BytesIO(await file.read()))
-    if len(script_text) < 100:
-        raise HTTPException(400, "PDF too short")
-
+    if file.size is not None and file.size > MAX_PDF_BYTES:
+        raise HTTPException(413, f"PDF exceeds the {MAX_PDF_BYTES >> 20} MB upload limit")
+
+    # Cinematographer chunks are dispatched as soon as enough pages have been
+    # extracted, so Groq works on the start of the script while the rest is parsed
+    async def analyze_camera_chunk(chunk: str, words: int) -> dict:
+        return await analyze_role("camera_chunk", chunk, max(1, words // WORDS_PER_PAGE))
+
+    parts, camera_tasks = [], []
+    pending = ""
+    page_count = 0
+    try:
+        async for text in stream_pdf_pages(file.file):
+            page_count += 1
+            if not text:
+                continue
+            parts.append(text)
+            chunks, pending = take_chunks(f"{pending}\n\n{text}" if pending else text)
+            for chunk, words in chunks:
+                camera_tasks.append(asyncio.ensure_future(analyze_camera_chunk(chunk, words)))
+        chunks, _ = take_chunks(pending, final=True)
+        for chunk, words in chunks:
+            camera_tasks.append(asyncio.ensure_future(analyze_camera_chunk(chunk, words)))
+
+        script_text = "\n\n".join(parts)
+        if len(script_text) < 100:
+            raise HTTPException(400, "PDF too short")
+    except BaseException:
+        for task in camera_tasks:
+            task.cancel()
+        raise
+    return parts, script_text, page_count, camera_tasks
+
+def start_roles(parts: List[str], script_text: str, page_count: int, camera_tasks: list) -> dict:
+    """Schedule the three role analyses concurrently; returns {role: task}"""
+    long_script = len(script_text.split()) > LONG_SCRIPT_WORDS
+
+    def needs_condensing(role: str) -> bool:
+        # The director is condensed for any long script; every whole-script role is when it would overflow the context
+        return (role == "director" and long_script) or len(script_text) > context_budget_chars(role, page_count)
+
+    combined = None
+    if COMBINE_ROLE_CALLS and not long_script and not needs_condensing("director_costume"):
+        combined = asyncio.ensure_future(analyze_role("director_costume", script_text, page_count))
+
+    condensed = None
+
+    def condensed_script() -> asyncio.Future:
+        # One set of block summaries, shared by every role that needs them
+        nonlocal condensed
+        if condensed is None:
+            condensed = asyncio.ensure_future(condense_script(parts))
+        return condensed
+
+    async def run_role(role: str) -> dict:
+        if role == "cinematographer":
+            chunk_analyses = await asyncio.gather(*camera_tasks, return_exceptions=True)
+            for analysis in chunk_analyses:
+                if isinstance(analysis, BaseException):
+                    raise analysis
+            synthesis = await analyze_role("cinematographer", camera_breakdown(chunk_analyses, parts), page_count)
+            return merge_camera_analyses(chunk_analyses, synthesis, page_count)
+        # Director and costume need the whole script, so they start once parsing is done
+        if combined is not None:
+            return (await combined)[role]
+        if needs_condensing(role):
+            return await analyze_role(role, await condensed_script(), page_count)
+        return await analyze_role(role, script_text, page_count)
+
+    return {role: asyncio.ensure_future(run_role(role)) for role in ROLES}
+
+def checked_analysis(role: str, outcome) -> tuple:
+    """(analysis, error): the role's result, validated when VALIDATE_LLM_OUTPUT is set, or why it failed"""
+    if isinstance(outcome, BaseException):
+        return None, str(outcome)
+    try:
+        return (ROLE_MODELS[role].model_validate(outcome) if VALIDATE_LLM_OUTPUT else outcome), None
+    except Exception as e:
+        return None, str(e)
+
+@app.post("/analyze-script-pdf", response_model=AllAnalysesResult, response_model_exclude_none=True)
+async def analyze_script_pdf(response: Response, file: UploadFile = File(...)):
+    parts, script_text, page_count, camera_tasks = await parse_and_dispatch(file)
     results = {"script_title": "Analysis In Progress", "total_pages": page_count}
 
-    for role in ["director", "cinematographer", "costume"]:
-        try:
-            if role == "cinematographer":
-                chunks = chunk_text(script_text)
-                scenes, shots = [], []
-                last = {}
-                for chunk in chunks:
-                    analysis = analyze_role(role, chunk, len(chunk.split())//250)
-                    scenes.extend(analysis.get("scenes", []))
-                    shots.extend(analysis.get("shots", []))
-                    last = analysis
-                analysis = {**last, "scenes": scenes, "shots": shots}
-            else:
-                analysis = analyze_role(role, script_text, page_count)
-            
-            model_map = {
-                "director": DirectorAnalysis,
-                "cinematographer": CameraAnalysis,
-                "costume": CostumeAnalysis
-            }
-            results[f"{role}_analysis"] = model_map[role](**analysis)
-            results["script_title"] = analysis.get("script_title", results["script_title"])
-        except Exception as e:
-            results[f"{role}_analysis"] = {"error": str(e)}
-
-    return AllAnalysesResult(**results)
+    # The three roles are independent Groq calls, so run them concurrently
+    role_tasks = start_roles(parts, script_text, page_count, camera_tasks)
+    outcomes = await asyncio.gather(*role_tasks.values(), return_exceptions=True)
+
+    errors = {}
+    for role, outcome in zip(role_tasks, outcomes):
+        analysis, error = checked_analysis(role, outcome)
+        if error is not None:
+            errors[role] = error
+            continue
+        results[f"{role}_analysis"] = analysis
+        results["script_title"] = outcome.get("script_title", results["script_title"])
+
+    # 207 Multi-Status: the request succeeded but some roles did not
+    status_code = 207 if errors else 200
+    if errors:
+        results["errors"] = errors
+
+    if not VALIDATE_LLM_OUTPUT:
+        # Returning a response directly skips response_model re-validation as well
+        return ORJSONResponse(results, status_code=status_code)
+    response.status_code = status_code
+    return AllAnalysesResult.model_validate(results)
+
+def ndjson_line(data: dict) -> bytes:
+    return orjson.dumps(data) + b"\n"
+
+async def stream_analysis(parts: List[str], script_text: str, page_count: int, camera_tasks: list):
+    """NDJSON events: each cinematographer chunk's scenes/shots as it lands, then each role as it finishes"""
+    role_tasks = start_roles(parts, script_text, page_count, camera_tasks)
+    chunk_numbers = {task: number for number, task in enumerate(camera_tasks, 1)}
+    script_title = "Analysis In Progress"
+    pending = set(chunk_numbers) | set(role_tasks.values())
+    roles_by_task = {task: role for role, task in role_tasks.items()}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                outcome = task.exception() or task.result()
+                if task in chunk_numbers:
+                    if isinstance(outcome, BaseException):
+                        event = {"event": "chunk", "chunk": chunk_numbers[task], "error": str(outcome)}
+                    else:
+                        event = {"event": "chunk", "chunk": chunk_numbers[task],
+                                 "scenes": outcome.get("scenes") or [], "shots": outcome.get("shots") or []}
+                    yield ndjson_line(event)
+                    continue
+                role = roles_by_task[task]
+                analysis, error = checked_analysis(role, outcome)
+                if error is not None:
+                    yield ndjson_line({"event": "analysis", "role": role, "error": error})
+                    continue
+                if isinstance(analysis, BaseModel):
+                    analysis = analysis.model_dump()
+                script_title = outcome.get("script_title", script_title)
+                yield ndjson_line({"event": "analysis", "role": role, "analysis": analysis})
+        yield ndjson_line({"event": "done", "script_title": script_title, "total_pages": page_count})
+    finally:
+        # Client went away or the stream ended: stop any Groq calls still running
+        for task in (*camera_tasks, *role_tasks.values()):
+            task.cancel()
+
+@app.post("/analyze-script-pdf/stream")
+async def analyze_script_pdf_stream(file: UploadFile = File(...)):
+    """Analyze a PDF script, streaming partial results as newline-delimited JSON"""
+    parts, script_text, page_count, camera_tasks = await parse_and_dispatch(file)
+    return StreamingResponse(
+        stream_analysis(parts, script_text, page_count, camera_tasks),
+        media_type="application/x-ndjson"
+    )
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await http_client.aclose()
+    pdf_process_pool.shutdown()
 
 if __name__ == "__main__":
     import uvicorn